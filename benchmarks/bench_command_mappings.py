@@ -0,0 +1,84 @@
+"""
+Compare scoring every window command mapping rule against the compiled
+mapping matcher.
+
+    python benchmarks/bench_command_mappings.py --rules 1000 --windows 200
+"""
+import random
+import time
+
+import click
+
+from i3_resurrect import programs
+
+
+def make_rules(count, rng):
+    rules = []
+    for n in range(count):
+        rule = {'command': f'program{n}'}
+        for criterion in rng.sample(list(programs.MATCH_CRITERIA_SCORES),
+                                    rng.randint(1, 3)):
+            rule[criterion] = f'{criterion}{rng.randrange(count // 4 + 1)}'
+        rules.append(rule)
+    return rules
+
+
+def make_windows(count, rules_count, rng):
+    return [
+        {
+            criterion: f'{criterion}{rng.randrange(rules_count // 4 + 1)}'
+            for criterion in programs.MATCH_CRITERIA_SCORES
+        }
+        for _ in range(count)
+    ]
+
+
+def linear_match(rules, window_properties):
+    current_score = 0
+    best_match = None
+    for rule in rules:
+        score = programs.calc_rule_match_score(rule, window_properties)
+        if score > current_score:
+            current_score = score
+            best_match = rule
+    return best_match
+
+
+@click.command()
+@click.option('--rules', default=1000, help='Number of mapping rules.')
+@click.option('--windows', default=200, help='Number of windows.')
+@click.option('--repeat', '-r', default=5, help='Number of runs per path.')
+@click.option('--seed', default=0, help='Random seed.')
+def main(rules, windows, repeat, seed):
+    rng = random.Random(seed)
+    rule_list = make_rules(rules, rng)
+    window_list = make_windows(windows, rules, rng)
+
+    start = time.perf_counter()
+    matcher = programs.MappingMatcher(rule_list)
+    compile_time = time.perf_counter() - start
+
+    linear_time = None
+    indexed_time = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        linear = [linear_match(rule_list, w) for w in window_list]
+        elapsed = time.perf_counter() - start
+        linear_time = min(linear_time or elapsed, elapsed)
+
+        start = time.perf_counter()
+        indexed = [matcher.match(w) for w in window_list]
+        elapsed = time.perf_counter() - start
+        indexed_time = min(indexed_time or elapsed, elapsed)
+
+        assert linear == indexed
+
+    print(f'{rules} rules, {windows} windows, best of {repeat} runs')
+    print(f'compile: {compile_time * 1000:.2f} ms')
+    print(f'linear:  {linear_time * 1000:.2f} ms')
+    print(f'indexed: {indexed_time * 1000:.2f} ms')
+    print(f'speedup: {linear_time / indexed_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
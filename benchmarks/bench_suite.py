@@ -0,0 +1,175 @@
+"""
+Time save and restore of whole sessions against a fake i3 (see fake_i3.py),
+for a range of workspace and window counts, and write the results as JSON.
+
+Every run is a separate i3-resurrect process, so the numbers include start up
+just like a key binding would. Save runs against a tree with the windows
+open; restore runs against the same workspaces empty, so that every program
+is launched and every layout appended (the fake i3 only records the
+commands).
+
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --compare results.json
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+import fake_i3
+
+REPO = Path(__file__).resolve().parent.parent
+
+# The most processes started to own the fake windows.
+MAX_PROCESSES = 20
+
+
+def parse_counts(value):
+    return [int(count) for count in value.split(',')]
+
+
+def run_resurrect(args, env):
+    """
+    Run i3-resurrect and return the wall time in seconds.
+    """
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, '-c',
+         'from i3_resurrect.main import main; main()'] + args,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def measure(workspaces, windows, repeat, directory):
+    """
+    Time saving and restoring one session size.
+
+    Returns:
+        One result dict for save and one for restore.
+    """
+    directory = Path(directory)
+    save_dir = directory / 'saved'
+    bin_dir = directory / 'bin'
+    bin_dir.mkdir()
+    fake_i3.write_stub_binaries(bin_dir)
+
+    processes = [
+        subprocess.Popen(['sleep', '3600'])
+        for _ in range(max(1, min(windows, MAX_PROCESSES)))
+    ]
+    i3 = fake_i3.FakeI3(directory / 'i3.sock',
+                        fake_i3.make_tree(workspaces, windows))
+    env = dict(os.environ)
+    env.pop('DISPLAY', None)
+    env.update({
+        'I3SOCK': i3.socket_path,
+        'I3_RESURRECT_BENCH_PIDS': ' '.join(str(p.pid) for p in processes),
+        'PATH': f'{bin_dir}{os.pathsep}{env.get("PATH", "")}',
+        'HOME': str(directory),
+        'PYTHONPATH': str(REPO),
+    })
+
+    results = []
+    try:
+        for operation, args, tree in [
+            ('save', ['save', '-S', '-d', str(save_dir)],
+             fake_i3.make_tree(workspaces, windows)),
+            ('restore', ['restore', '-S', '-d', str(save_dir)],
+             fake_i3.make_tree(workspaces, 0)),
+        ]:
+            i3.set_tree(tree)
+            times = []
+            for _ in range(repeat):
+                i3.reset_commands()
+                times.append(run_resurrect(args, env))
+            results.append({
+                'operation': operation,
+                'workspaces': workspaces,
+                'windows': windows,
+                'best': min(times),
+                'median': statistics.median(times),
+                'commands': len(i3.commands),
+            })
+    finally:
+        i3.close()
+        for process in processes:
+            process.kill()
+            process.wait()
+    return results
+
+
+def compare(old, new):
+    """
+    Print how the results changed since an earlier run.
+    """
+    def key(result):
+        return (result['operation'], result['workspaces'], result['windows'])
+
+    old_results = {key(result): result for result in old['results']}
+    print(f'{"operation":<10}{"workspaces":>11}{"windows":>9}'
+          f'{"before":>11}{"after":>11}{"change":>9}')
+    for result in new['results']:
+        before = old_results.get(key(result))
+        if before is None:
+            continue
+        change = result['best'] / before['best'] - 1
+        print(f'{result["operation"]:<10}{result["workspaces"]:>11}'
+              f'{result["windows"]:>9}{before["best"] * 1000:>9.1f}ms'
+              f'{result["best"] * 1000:>9.1f}ms{change:>+9.0%}')
+
+
+@click.command()
+@click.option('--workspaces', '-w', 'workspace_counts',
+              default='1,10,50',
+              help='Comma separated workspace counts. [default: 1,10,50]')
+@click.option('--windows', '-n', 'window_counts',
+              default='1,100,500',
+              help='Comma separated total window counts. [default: 1,100,500]')
+@click.option('--repeat', '-r', default=3, help='Number of runs per size.')
+@click.option('--output', '-o',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help='Write the results to this file instead of stdout.')
+@click.option('--compare', '-c', 'compare_path',
+              type=click.Path(exists=True, dir_okay=False),
+              default=None,
+              help='Earlier results to compare against.')
+def main(workspace_counts, window_counts, repeat, output, compare_path):
+    results = []
+    for workspaces in parse_counts(workspace_counts):
+        for windows in parse_counts(window_counts):
+            with tempfile.TemporaryDirectory() as directory:
+                results.extend(measure(workspaces, windows, repeat,
+                                       directory))
+            click.echo(f'{workspaces} workspaces, {windows} windows done',
+                       err=True)
+
+    report = {
+        'python': platform.python_version(),
+        'git_revision': subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        ).stdout.decode('utf-8').strip() or None,
+        'repeat': repeat,
+        'results': results,
+    }
+    if compare_path is not None:
+        compare(json.loads(Path(compare_path).read_text()), report)
+    elif output is None:
+        print(json.dumps(report, indent=2))
+    if output is not None:
+        Path(output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Compare walking a workspace three times recursively (building the layout and
+finding the windows for the programs and for the daemon) against the single
+iterative pass.
+
+    python benchmarks/bench_tree.py --containers 5000
+"""
+import random
+import re
+import time
+
+import click
+
+from i3_resurrect import treeutils
+
+SWALLOW = ['class', 'instance', 'title']
+
+
+def make_tree(count, rng):
+    workspace = {'id': 0, 'type': 'workspace', 'name': '1', 'num': 1,
+                 'layout': 'splith', 'nodes': [], 'floating_nodes': []}
+    splits = [workspace]
+    for n in range(1, count):
+        parent = rng.choice(splits)
+        if rng.random() < 0.2:
+            node = {'id': n, 'type': 'con', 'layout': 'splitv',
+                    'nodes': [], 'floating_nodes': []}
+            splits.append(node)
+        else:
+            node = {
+                'id': n,
+                'type': 'con',
+                'name': f'Window {n} (1/2)',
+                'window': n,
+                'window_properties': {
+                    'class': f'Class{n % 50}',
+                    'instance': f'instance{n % 50}',
+                    'title': f'Window {n} (1/2)',
+                },
+                'nodes': [],
+                'floating_nodes': [],
+            }
+        parent['nodes'].append(node)
+    return workspace
+
+
+def recursive_process_node(original, swallow, window_swallow_criteria):
+    processed = {}
+    if original is None or original == {}:
+        return processed
+    for attribute in treeutils.REQUIRED_ATTRIBUTES:
+        if attribute in original:
+            processed[attribute] = original[attribute]
+    if 'type' in original and original['type'] == 'floating_con':
+        processed['rect'] = original['rect']
+    if 'window_properties' in original:
+        processed['swallows'] = [{}]
+        swallow_criteria = swallow
+        window_class = original['window_properties'].get('class', '')
+        if window_class in window_swallow_criteria:
+            swallow_criteria = window_swallow_criteria[window_class]
+        for criterion in swallow_criteria:
+            if criterion in original['window_properties']:
+                escaped = re.escape(original['window_properties'][criterion])
+                processed['swallows'][0][criterion] = f'^{escaped}$'
+    for node_type in ['nodes', 'floating_nodes']:
+        if node_type in original and original[node_type] != []:
+            processed[node_type] = [
+                recursive_process_node(child, swallow,
+                                       window_swallow_criteria)
+                for child in original[node_type]
+            ]
+    return processed
+
+
+def recursive_get_leaves(container):
+    nodes = container.get('nodes', []) + container.get('floating_nodes', [])
+    for node in nodes:
+        if 'window_properties' in node:
+            yield node
+        yield from recursive_get_leaves(node)
+
+
+@click.command()
+@click.option('--containers', '-c', default=5000,
+              help='Number of containers in the workspace.')
+@click.option('--repeat', '-r', default=5, help='Number of runs per path.')
+@click.option('--seed', default=0, help='Random seed.')
+def main(containers, repeat, seed):
+    tree = make_tree(containers, random.Random(seed))
+
+    recursive_time = None
+    single_time = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        layout = recursive_process_node(tree, SWALLOW, {})
+        leaves = list(recursive_get_leaves(tree))
+        list(recursive_get_leaves(tree))
+        elapsed = time.perf_counter() - start
+        recursive_time = min(recursive_time or elapsed, elapsed)
+
+        # A new snapshot each time so that nothing is reused between runs.
+        snapshot = {'by_name': {'1': tree}, 'by_num': {1: tree}}
+        start = time.perf_counter()
+        single_layout, single_leaves = treeutils.process_workspace(
+            '1', False, SWALLOW, snapshot)
+        treeutils.get_workspace_leaves('1', False, snapshot)
+        elapsed = time.perf_counter() - start
+        single_time = min(single_time or elapsed, elapsed)
+
+        assert single_layout == layout
+        assert single_leaves == leaves
+
+    print(f'{containers} containers, {len(leaves)} windows, '
+          f'best of {repeat} runs')
+    print(f'recursive, 3 walks: {recursive_time * 1000:.2f} ms')
+    print(f'single pass:        {single_time * 1000:.2f} ms')
+    print(f'speedup: {recursive_time / single_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare decoding the whole i3 tree against decoding only the workspace being
+saved or restored, on a tree with many outputs and workspaces.
+
+    python benchmarks/bench_tree_parse.py --workspaces 40 --windows 50
+"""
+import json
+import time
+
+import click
+
+from i3_resurrect import treeutils
+
+
+def make_workspace(ws_id, num, windows):
+    nodes = []
+    for n in range(windows):
+        window_id = ws_id + n + 1
+        nodes.append({
+            'id': window_id,
+            'type': 'con',
+            'layout': 'splith',
+            'name': f'Window {window_id}',
+            'window': window_id,
+            'window_properties': {
+                'class': f'Class{n % 10}',
+                'instance': f'instance{n % 10}',
+                'title': f'Window {window_id}',
+            },
+            'rect': {'x': 0, 'y': 0, 'width': 100, 'height': 100},
+            'nodes': [],
+            'floating_nodes': [],
+        })
+    return {'id': ws_id, 'type': 'workspace', 'layout': 'splith',
+            'name': str(num), 'num': num, 'nodes': nodes,
+            'floating_nodes': []}
+
+
+def make_tree(workspaces, windows, outputs):
+    root = {'id': 1, 'type': 'root', 'name': 'root', 'nodes': []}
+    for output in range(outputs):
+        content = {'id': 2 + output * 2, 'type': 'con', 'name': 'content',
+                   'nodes': []}
+        root['nodes'].append({'id': 3 + output * 2, 'type': 'output',
+                              'name': f'OUTPUT-{output}',
+                              'nodes': [content]})
+    for num in range(1, workspaces + 1):
+        content = root['nodes'][num % outputs]['nodes'][0]
+        content['nodes'].append(
+            make_workspace(num * 100000, num, windows))
+    return json.dumps(root)
+
+
+@click.command()
+@click.option('--workspaces', '-w', default=40, help='Number of workspaces.')
+@click.option('--windows', '-n', default=50, help='Windows per workspace.')
+@click.option('--outputs', '-o', default=3, help='Number of outputs.')
+@click.option('--repeat', '-r', default=5, help='Number of runs per path.')
+def main(workspaces, windows, outputs, repeat):
+    raw_tree = make_tree(workspaces, windows, outputs)
+    target = str(workspaces // 2)
+
+    full_time = None
+    partial_time = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        full = treeutils.index_workspaces(json.loads(raw_tree))
+        elapsed = time.perf_counter() - start
+        full_time = min(full_time or elapsed, elapsed)
+
+        start = time.perf_counter()
+        partial = treeutils.extract_workspaces(raw_tree, [target])
+        elapsed = time.perf_counter() - start
+        partial_time = min(partial_time or elapsed, elapsed)
+
+        assert partial['by_name'][target] == full['by_name'][target]
+
+    print(f'{len(raw_tree) / 1e6:.1f} MB tree, {workspaces} workspaces, '
+          f'best of {repeat} runs')
+    print(f'whole tree:     {full_time * 1000:.2f} ms')
+    print(f'one workspace:  {partial_time * 1000:.2f} ms')
+    print(f'speedup: {full_time / partial_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Compare looking up window PIDs with xprop against the batched Xlib lookup,
+and check that both find the same PIDs.
+
+Run inside a running i3 session:
+
+    python benchmarks/bench_window_pids.py --repeat 5
+"""
+import time
+
+import click
+import i3ipc
+
+from i3_resurrect import treeutils
+from i3_resurrect import x11
+
+
+def time_call(function, repeat):
+    """
+    Return the best wall time in seconds out of `repeat` calls to `function`.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+@click.command()
+@click.option('--repeat', '-r', default=5, help='Number of runs per path.')
+def main(repeat):
+    i3 = i3ipc.Connection()
+    window_ids = [
+        con['window']
+        for con in treeutils.get_leaves(i3.get_tree().ipc_data)
+        if con['window'] is not None
+    ]
+    print(f'{len(window_ids)} windows, best of {repeat} runs')
+
+    xprop_time = time_call(
+        lambda: [x11.xprop_window_pid(window_id) for window_id in window_ids],
+        repeat,
+    )
+    print(f'xprop: {xprop_time * 1000:.2f} ms')
+
+    if x11.get_display() is None:
+        print('xlib:  unavailable (python-xlib missing or no display)')
+        return
+
+    xprop_pids = {
+        window_id: x11.xprop_window_pid(window_id) for window_id in window_ids
+    }
+    xlib_pids = x11.get_window_pids(window_ids)
+    assert xlib_pids == xprop_pids, 'xlib and xprop found different PIDs'
+
+    xlib_time = time_call(lambda: x11.get_window_pids(window_ids), repeat)
+    print(f'xlib:  {xlib_time * 1000:.2f} ms')
+    if xlib_time > 0:
+        print(f'speedup: {xprop_time / xlib_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+"""
+Stand-in for a running i3 session, for benchmarking without X or i3.
+
+FakeI3 listens on a Unix socket and speaks enough of the i3 IPC protocol for
+i3-resurrect: it serves a synthetic layout tree and workspace list, and
+records the commands it is sent (switching workspaces as it goes). The stub
+xprop and xdotool binaries written by write_stub_binaries() answer PID lookups
+with the PIDs of real processes, so that process information can be read as
+usual.
+
+Point i3-resurrect at it with I3SOCK=<socket path>, put the stub directory
+first in PATH and unset DISPLAY so that the xprop fallback is used.
+"""
+import json
+import os
+import socket
+import struct
+import threading
+from pathlib import Path
+
+MAGIC = b'i3-ipc'
+
+HEADER = struct.Struct(f'={len(MAGIC)}sII')
+
+RUN_COMMAND = 0
+GET_WORKSPACES = 1
+SUBSCRIBE = 2
+GET_TREE = 4
+
+# The first X window id handed out.
+FIRST_WINDOW = 0x400000
+
+XPROP = '''#!/bin/sh
+# xprop _NET_WM_PID -id WINDOW
+window=$3
+set -- $I3_RESURRECT_BENCH_PIDS
+shift $(( window % $# ))
+echo "_NET_WM_PID(CARDINAL) = $1"
+'''
+
+XDOTOOL = '''#!/bin/sh
+exit 0
+'''
+
+
+def make_tree(workspaces, windows):
+    """
+    Build a layout tree with windows spread evenly over the workspaces.
+
+    Every container has the keys i3 always sends, in the order i3 sends them
+    in: id and type first, then the properties, name and number, and the
+    child nodes towards the end.
+
+    Args:
+        workspaces: The number of workspaces.
+        windows: The total number of windows, or 0 for empty workspaces.
+    """
+    ids = iter(range(1, 1 << 30))
+    no_rect = {'x': 0, 'y': 0, 'width': 0, 'height': 0}
+
+    def con(node_type, name=None, num=None, layout='splith', nodes=None,
+            window=None, window_properties=None, rect=None):
+        node = {
+            'id': next(ids),
+            'type': node_type,
+            'orientation': 'vertical' if layout == 'splitv' else 'horizontal',
+            'scratchpad_state': 'none',
+            'percent': None,
+            'urgent': False,
+            'marks': [],
+            'focused': False,
+            'output': 'FAKE-1',
+            'layout': layout,
+            'workspace_layout': 'default',
+            'last_split_layout': layout,
+            'border': 'normal',
+            'current_border_width': -1,
+            'rect': rect or dict(no_rect),
+            'deco_rect': dict(no_rect),
+            'window_rect': dict(no_rect),
+            'geometry': dict(no_rect),
+            'name': name,
+        }
+        if num is not None:
+            node['num'] = num
+        node['window'] = window
+        node['window_type'] = 'normal' if window is not None else None
+        if window_properties is not None:
+            node['window_properties'] = window_properties
+        node.update({
+            'nodes': nodes or [],
+            'floating_nodes': [],
+            'focus': [],
+            'fullscreen_mode': 0,
+            'sticky': False,
+            'floating': 'auto_off',
+            'swallows': [],
+        })
+        return node
+
+    scratchpad = con('workspace', '__i3_scratch', num=-1)
+    content = con('con', 'content')
+    root = con('root', 'root', nodes=[
+        con('output', '__i3', nodes=[con('con', 'content',
+                                         nodes=[scratchpad])]),
+        con('output', 'FAKE-1', nodes=[content]),
+    ])
+
+    window = FIRST_WINDOW
+    for num in range(1, workspaces + 1):
+        workspace = con('workspace', str(num), num=num)
+        content['nodes'].append(workspace)
+        count = windows // workspaces + (num <= windows % workspaces)
+        # Two windows side by side per vertical split.
+        split = None
+        for n in range(count):
+            if n % 2 == 0:
+                split = con('con', layout='splitv')
+                workspace['nodes'].append(split)
+            title = f'Window {window} - Program {n % 20}'
+            split['nodes'].append(con(
+                'con', title,
+                window=window,
+                window_properties={
+                    'class': f'Program{n % 20}',
+                    'instance': f'program{n % 20}',
+                    'title': title,
+                    'transient_for': None,
+                },
+                rect={'x': 0, 'y': 0, 'width': 800, 'height': 600},
+            ))
+            window += 1
+
+    # Like i3, list the children of every container in focus order.
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        children = node['nodes'] + node['floating_nodes']
+        node['focus'] = [child['id'] for child in children]
+        stack.extend(children)
+    return root
+
+
+def write_stub_binaries(directory):
+    """
+    Write the stub xprop and xdotool binaries to a directory.
+    """
+    for name, script in [('xprop', XPROP), ('xdotool', XDOTOOL)]:
+        path = Path(directory) / name
+        path.write_text(script)
+        path.chmod(0o755)
+
+
+class FakeI3:
+    """
+    Fake i3 IPC server running in a background thread.
+
+    Args:
+        socket_path: The socket to listen on.
+        tree: The layout tree to serve (see make_tree).
+    """
+
+    def __init__(self, socket_path, tree):
+        self.socket_path = str(socket_path)
+        self.commands = []
+        self._lock = threading.Lock()
+        self.set_tree(tree)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.socket_path)
+        self._listener.listen(16)
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def set_tree(self, tree):
+        """
+        Serve a new layout tree, focusing its first workspace.
+        """
+        with self._lock:
+            self._raw_tree = json.dumps(tree).encode('utf-8')
+            self._workspaces = [
+                workspace
+                for output in tree['nodes'] if output['name'] != '__i3'
+                for content in output['nodes']
+                for workspace in content['nodes']
+            ]
+            self._focused = self._workspaces[0]['name']
+
+    def reset_commands(self):
+        """
+        Forget the recorded commands.
+        """
+        with self._lock:
+            self.commands = []
+
+    def close(self):
+        self._listener.close()
+        os.unlink(self.socket_path)
+
+    def _serve(self):
+        while True:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(connection,),
+                             daemon=True).start()
+
+    def _handle(self, connection):
+        with connection:
+            while True:
+                header = _recv_exactly(connection, HEADER.size)
+                if header is None:
+                    return
+                _, length, message_type = HEADER.unpack(header)
+                payload = _recv_exactly(connection, length) or b''
+                reply = self._reply(message_type, payload.decode('utf-8'))
+                connection.sendall(
+                    HEADER.pack(MAGIC, len(reply), message_type) + reply)
+
+    def _reply(self, message_type, payload):
+        with self._lock:
+            if message_type == GET_TREE:
+                return self._raw_tree
+            if message_type == GET_WORKSPACES:
+                reply = [self._workspace_reply(ws) for ws in self._workspaces]
+            elif message_type == RUN_COMMAND:
+                commands = payload.split('; ')
+                self.commands.extend(commands)
+                for command in commands:
+                    if command.startswith('workspace '):
+                        self._focused = command.split()[-1]
+                reply = [{'success': True} for _ in commands]
+            elif message_type == SUBSCRIBE:
+                reply = {'success': True}
+            else:
+                reply = {}
+        return json.dumps(reply).encode('utf-8')
+
+    def _workspace_reply(self, workspace):
+        return {
+            'id': workspace['id'],
+            'num': workspace['num'],
+            'name': workspace['name'],
+            'visible': workspace['name'] == self._focused,
+            'focused': workspace['name'] == self._focused,
+            'urgent': False,
+            'rect': {'x': 0, 'y': 0, 'width': 1920, 'height': 1080},
+            'output': 'FAKE-1',
+        }
+
+
+def _recv_exactly(connection, size):
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
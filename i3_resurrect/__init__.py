@@ -1,8 +1,15 @@
-__all__ = ['config', 'layout', 'main', 'programs', 'treeutils', 'util']
-
-from . import config
-from . import layout
-from . import main
-from . import programs
-from . import treeutils
-from . import util
+"""
+Save and restore i3 workspaces.
+
+The submodules are imported when they are first used, so that a command only
+pays for the modules it needs.
+"""
+import importlib
+
+__all__ = ['bundle', 'config', 'daemon', 'engine', 'index', 'ipc', 'layout', 'main', 'metrics', 'programs', 'server', 'swallow', 'timing', 'treeutils', 'util', 'x11']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,267 @@
+"""
+Session bundles: a whole saved session in a single file.
+
+A bundle starts with a magic line and a one line JSON header which indexes
+the records in the rest of the file:
+
+    i3-resurrect-bundle 1
+    {"format": "json", "compression": "gzip", "workspaces": {...}}
+    <records>
+
+Every workspace's layout and programs are separate records which are encoded
+(compact JSON or msgpack) and compressed (gzip or zstd) on their own, so one
+workspace can be read by seeking to its records without decoding the others.
+"""
+import gzip
+import importlib
+import io
+import json
+from pathlib import Path
+
+from . import util
+
+BUNDLE_FILENAME = 'session.bundle'
+
+FORMATS = ['json', 'msgpack']
+
+COMPRESSIONS = ['none', 'gzip', 'zstd']
+
+PARTS = ['layout', 'programs']
+
+_MAGIC = b'i3-resurrect-bundle 1\n'
+
+# The optional modules which have been imported, or None for missing ones.
+_modules = {}
+
+
+def get_path(directory):
+    """
+    Get the path of the bundle in a save directory.
+    """
+    return Path(directory) / BUNDLE_FILENAME
+
+
+def unavailable(data_format, compression):
+    """
+    Get the name of the missing module needed for a format and compression,
+    or None if both can be used.
+    """
+    if data_format == 'msgpack' and _module('msgpack') is None:
+        return 'msgpack'
+    if compression == 'zstd' and _module('zstandard') is None:
+        return 'zstandard'
+    return None
+
+
+def target_part(target):
+    """
+    Get the part of the saved workspaces that a save or restore target
+    ('layout_only', 'programs_only' or None) applies to, or None for both.
+    """
+    if target == 'layout_only':
+        return 'layout'
+    if target == 'programs_only':
+        return 'programs'
+    return None
+
+
+def write(path, workspaces, data_format='json', compression='none',
+          skip_unchanged=False):
+    """
+    Write a bundle.
+
+    Args:
+        path: The file to write.
+        workspaces: Dict mapping workspace ids to dicts with optional 'layout'
+            and 'programs' entries.
+        data_format: One of FORMATS.
+        compression: One of COMPRESSIONS.
+        skip_unchanged: Don't rewrite the bundle if its content is the same.
+
+    Returns:
+        True if the bundle was written, False if it was skipped.
+    """
+    index = {}
+    records = []
+    offset = 0
+    for workspace_id, workspace in workspaces.items():
+        entry = {}
+        layout = workspace.get('layout')
+        if layout is not None:
+            entry['name'] = layout.get('name')
+        for part in PARTS:
+            if workspace.get(part) is None:
+                continue
+            record = _encode(workspace[part], data_format, compression)
+            entry[part] = [offset, len(record)]
+            records.append(record)
+            offset += len(record)
+        index[workspace_id] = entry
+
+    header = {
+        'format': data_format,
+        'compression': compression,
+        'workspaces': index,
+    }
+    data = b''.join([
+        _MAGIC,
+        json.dumps(header, separators=(',', ':')).encode('utf-8'),
+        b'\n',
+    ] + records)
+    return util.write_atomic(path, data, skip_unchanged)
+
+
+def read_header(path):
+    """
+    Read the header of a bundle.
+
+    Returns:
+        The header dict, or None if the file doesn't exist.
+
+    Raises:
+        ValueError: The file is not a bundle.
+    """
+    try:
+        with Path(path).open('rb') as f:
+            return _read_header(f)[0]
+    except FileNotFoundError:
+        return None
+
+
+def read_workspace(path, workspace_id, part):
+    """
+    Read one part of a single workspace from a bundle.
+
+    Args:
+        path: The bundle file.
+        workspace_id: The id of the workspace.
+        part: Either 'layout' or 'programs'.
+
+    Returns:
+        The saved data, or None if it isn't in the bundle.
+    """
+    try:
+        with Path(path).open('rb') as f:
+            header, body_offset = _read_header(f)
+            entry = header['workspaces'].get(workspace_id, {})
+            if part not in entry:
+                return None
+            offset, length = entry[part]
+            f.seek(body_offset + offset)
+            return _decode(f.read(length), header)
+    except FileNotFoundError:
+        return None
+
+
+def load(path):
+    """
+    Read every workspace from a bundle.
+
+    Returns:
+        The header and a dict mapping workspace ids to dicts with optional
+        'layout' and 'programs' entries, in the order they were saved.
+    """
+    with Path(path).open('rb') as f:
+        header, body_offset = _read_header(f)
+        body = f.read()
+
+    workspaces = {}
+    for workspace_id, entry in header['workspaces'].items():
+        workspace = {}
+        for part in PARTS:
+            if part in entry:
+                offset, length = entry[part]
+                workspace[part] = _decode(body[offset:offset + length],
+                                          header)
+        workspaces[workspace_id] = workspace
+    return header, workspaces
+
+
+def remove(path, workspace_ids=None, part=None):
+    """
+    Remove workspaces from a bundle, deleting the bundle when it becomes
+    empty.
+
+    Args:
+        path: The bundle file.
+        workspace_ids: The workspaces to remove, or None for all of them.
+        part: Only remove this part ('layout' or 'programs') of the
+            workspaces.
+    """
+    path = Path(path)
+    if not path.is_file():
+        return
+
+    header, workspaces = load(path)
+    changed = False
+    for workspace_id in list(workspaces):
+        if workspace_ids is not None and workspace_id not in workspace_ids:
+            continue
+        if part is None:
+            del workspaces[workspace_id]
+            changed = True
+        elif part in workspaces[workspace_id]:
+            del workspaces[workspace_id][part]
+            changed = True
+            if not workspaces[workspace_id]:
+                del workspaces[workspace_id]
+
+    if not changed:
+        return
+    if workspaces:
+        write(path, workspaces, header['format'], header['compression'])
+    else:
+        path.unlink()
+
+
+def _module(name):
+    """
+    Import an optional module on first use.
+    """
+    if name not in _modules:
+        try:
+            _modules[name] = importlib.import_module(name)
+        except ImportError:
+            _modules[name] = None
+    return _modules[name]
+
+
+def _read_header(f):
+    if f.readline() != _MAGIC:
+        raise ValueError(f'{f.name} is not an i3-resurrect session bundle')
+    header = json.loads(f.readline())
+    return header, f.tell()
+
+
+def _encode(data, data_format, compression):
+    if data_format == 'msgpack':
+        encoded = _module('msgpack').packb(data, use_bin_type=True)
+    else:
+        encoded = json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    if compression == 'gzip':
+        # Leave the timestamp out so that unchanged data compresses to the
+        # same bytes.
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as f:
+            f.write(encoded)
+        return buffer.getvalue()
+    if compression == 'zstd':
+        return _module('zstandard').ZstdCompressor().compress(encoded)
+    return encoded
+
+
+def _decode(record, header):
+    compression = header.get('compression', 'none')
+    missing = unavailable(header.get('format'), compression)
+    if missing is not None:
+        raise ValueError(f'Reading this bundle requires the {missing} module')
+
+    if compression == 'gzip':
+        record = gzip.decompress(record)
+    elif compression == 'zstd':
+        record = _module('zstandard').ZstdDecompressor().decompress(record)
+
+    if header.get('format') == 'msgpack':
+        return _module('msgpack').unpackb(record, raw=False)
+    return json.loads(record.decode('utf-8'))
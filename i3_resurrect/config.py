@@ -1,19 +1,119 @@
 """
 Lazy-initialized singleton for config.
+
+Nothing is read or written until the first value is needed. The config file is
+parsed and validated once, and only loaded again when its modification time
+changes, so long-running processes pick up edits without rereading it every
+time. If an edited file can't be loaded, the last valid config stays in use.
 """
 import json
+import sys
 from pathlib import Path
 
+from . import util
+
+
+class Config:
+    """
+    A parsed and validated config.
+
+    Besides the raw values, it holds the forms the per-window code needs:
+    the terminals as a set, the swallow criteria per window class as tuples
+    and the compiled window command mappings.
+
+    Args:
+        data: The config as read from the file.
+        mtime: The modification time of the file it was read from in
+            nanoseconds, or None if it wasn't read from the file.
+
+    Raises:
+        ValueError: The config is not valid.
+    """
+
+    def __init__(self, data, mtime=None):
+        validate(data)
+        self.data = data
+        self.mtime = mtime
+        self.window_command_mappings = data.get('window_command_mappings', [])
+        self.terminals = frozenset(data.get('terminals', []))
+        self.window_swallow_criteria = {
+            window_class: tuple(criteria)
+            for window_class, criteria
+            in data.get('window_swallow_criteria', {}).items()
+        }
+        self._mapping_matcher = None
+
+    def get(self, key, default):
+        """
+        Gets a raw config value.
+        """
+        return self.data.get(key, default)
+
+    @property
+    def mapping_matcher(self):
+        """
+        The compiled window command mappings, or None if they use the
+        deprecated dictionary format.
+        """
+        if isinstance(self.window_command_mappings, dict):
+            return None
+        if self._mapping_matcher is None:
+            from . import programs
+
+            self._mapping_matcher = programs.MappingMatcher(
+                self.window_command_mappings)
+        return self._mapping_matcher
+
+
+def validate(data):
+    """
+    Check that a config has the expected structure.
+
+    Raises:
+        ValueError: Describing the first problem found.
+    """
+    if not isinstance(data, dict):
+        raise ValueError('the config must be an object')
+
+    mappings = data.get('window_command_mappings', [])
+    if isinstance(mappings, dict):
+        # Deprecated format mapping window classes to commands.
+        rules = [{'command': command} for command in mappings.values()]
+    elif isinstance(mappings, list):
+        rules = mappings
+    else:
+        raise ValueError('"window_command_mappings" must be a list')
+    for rule in rules:
+        if not isinstance(rule, dict):
+            raise ValueError('every window command mapping must be an object')
+        command = rule.get('command', '')
+        if not (isinstance(command, str)
+                or (isinstance(command, list)
+                    and all(isinstance(arg, str) for arg in command))):
+            raise ValueError('a window command mapping\'s "command" must be '
+                             'a string or a list of strings')
+
+    terminals = data.get('terminals', [])
+    if (not isinstance(terminals, list)
+            or not all(isinstance(t, str) for t in terminals)):
+        raise ValueError('"terminals" must be a list of window classes')
+
+    swallow_criteria = data.get('window_swallow_criteria', {})
+    if (not isinstance(swallow_criteria, dict)
+            or not all(isinstance(criteria, list)
+                       and all(isinstance(c, str) for c in criteria)
+                       for criteria in swallow_criteria.values())):
+        raise ValueError('"window_swallow_criteria" must map window classes '
+                         'to lists of criteria')
+
 
 def create_default():
     """
     Creates the default config file.
     """
     global _config
-    global _config_dir
-    global _config_file
 
-    _config = {
+    data = {
         'window_command_mappings': [
             {
                 'class': 'Gnome-terminal',
@@ -29,37 +129,87 @@ def create_default():
 
     # Write default config.
     with _config_file.open('w') as f:
-        f.write(json.dumps(_config, indent=2))
+        f.write(json.dumps(data, indent=2))
 
+    _config = Config(data, _get_mtime())
 
-def get(key, default):
+
+def current():
     """
-    Gets a config value.
+    Gets the current config, loading it again if the file has changed.
+
+    Exits if the config can't be loaded the first time. A failed reload keeps
+    the previous config, so that a half-written edit doesn't stop a
+    long-running process.
     """
     global _config
+    global _rejected_mtime
+
+    if isinstance(_config, dict):
+        # Set directly rather than read from the file.
+        _config = Config(_config)
 
-    # Load config if it hasn't already been loaded.
     if _config is None:
         try:
-            _config = json.loads(_config_file.read_text())
-        except json.decoder.JSONDecodeError as e:
-            print(f'Error in config file: "{str(e)}"')
-            exit(1)
-        except PermissionError as e:
-            print(f'Could not read config file: {str(e)}')
-            exit(1)
-        except FileNotFoundError:
-            # Create default config if no config exists.
-            create_default()
+            load()
+        except ValueError as e:
+            print(str(e))
+            sys.exit(1)
+    elif _config.mtime is not None:
+        mtime = _get_mtime()
+        if mtime != _config.mtime and mtime != _rejected_mtime:
+            try:
+                load()
+            except ValueError as e:
+                # Don't try again until the file changes.
+                _rejected_mtime = mtime
+                util.eprint(f'{str(e)} (keeping the previous config)')
 
-    return _config.get(key, default)
+    return _config
+
+
+def get(key, default):
+    """
+    Gets a config value.
+    """
+    return current().get(key, default)
+
+
+def load():
+    """
+    Loads the config file, creating the default config if there is none.
+
+    Raises:
+        ValueError: The config file can't be read or isn't valid. The current
+            config is left as it is.
+    """
+    global _config
+
+    try:
+        mtime = _get_mtime()
+        _config = Config(json.loads(_config_file.read_text()), mtime)
+    except json.decoder.JSONDecodeError as e:
+        raise ValueError(f'Error in config file: "{str(e)}"')
+    except ValueError as e:
+        raise ValueError(f'Error in config file: {str(e)}')
+    except PermissionError as e:
+        raise ValueError(f'Could not read config file: {str(e)}')
+    except FileNotFoundError:
+        # Create default config if no config exists.
+        create_default()
+
+
+def _get_mtime():
+    try:
+        return _config_file.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
 
 
 _config = None
 
+# Modification time of the last config file which failed to load.
+_rejected_mtime = None
+
 _config_dir = Path('~/.config/i3-resurrect/').expanduser()
 _config_file = _config_dir / 'config.json'
-
-if not _config_file.is_file():
-    # Create default config if no config exists.
-    create_default()
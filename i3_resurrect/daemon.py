@@ -0,0 +1,175 @@
+"""
+Background daemon which saves workspaces whenever they change.
+"""
+import threading
+import time
+
+from . import index
+from . import ipc
+from . import metrics
+from . import programs
+from . import treeutils
+from . import util
+
+# Window event changes which don't affect what is saved.
+IGNORED_WINDOW_CHANGES = ['focus', 'urgent']
+
+# Workspace event changes which don't affect what is saved.
+IGNORED_WORKSPACE_CHANGES = ['focus', 'init', 'empty', 'urgent']
+
+
+class SaveDaemon:
+    """
+    Listens to i3 window and workspace events and re-saves the workspaces
+    which changed.
+
+    Events are coalesced: a save happens once no event has arrived for `delay`
+    seconds, but never later than `max_delay` seconds after the first unsaved
+    event, and it covers every workspace touched since the previous save.
+    Up to `jobs` workspaces are saved and processes inspected in parallel.
+    If `metrics_file` is given, the metrics are written to it after every
+    save (see metrics.write_textfile).
+    """
+
+    def __init__(self, directory, numeric, swallow_criteria, target,
+                 delay=2.0, max_delay=30.0, jobs=4, metrics_file=None):
+        self.directory = directory
+        self.numeric = numeric
+        self.swallow_criteria = swallow_criteria
+        self.target = target
+        self.delay = delay
+        self.max_delay = max_delay
+        self.jobs = jobs
+        self.metrics_file = metrics_file
+
+        self._i3 = None
+        self._cond = threading.Condition()
+        self._dirty_windows = set()
+        self._dirty_workspaces = set()
+        self._first_event = None
+        self._last_event = None
+        # Workspace that each window was in when it was last saved, so that a
+        # window which closes or moves marks its old workspace as changed.
+        self._window_workspaces = {}
+        # Process information is kept between saves.
+        self._process_cache = programs.ProcessCache(jobs)
+
+    def run(self):
+        """
+        Save every workspace once and then keep saving changes until i3 exits.
+        """
+        import i3ipc
+
+        self._i3 = ipc.Context(i3ipc.Connection(auto_reconnect=True))
+        self._i3.connection.on('window', self._on_window)
+        self._i3.connection.on('workspace', self._on_workspace)
+
+        # Start with a full save.
+        self.save(set(), None)
+
+        writer = threading.Thread(target=self._writer, daemon=True)
+        writer.start()
+        self._i3.connection.main()
+
+    def save(self, window_ids, workspaces):
+        """
+        Save the workspaces containing or previously containing the given
+        windows, and the given workspaces.
+
+        Args:
+            window_ids: Ids of the containers of windows which changed.
+            workspaces: Names of workspaces which changed, or None to save all
+                of them.
+        """
+        snapshot = treeutils.get_tree_snapshot(self._i3)
+        self._process_cache.begin_run()
+
+        window_workspaces = {}
+        for name in snapshot['by_name']:
+            # The walk is kept in the snapshot and reused when saving.
+            for con in treeutils.get_workspace_leaves(name, False, snapshot):
+                window_workspaces[con['id']] = name
+
+        if workspaces is None:
+            workspaces = set(snapshot['by_name'])
+        for window_id in window_ids:
+            for mapping in [self._window_workspaces, window_workspaces]:
+                if window_id in mapping:
+                    workspaces.add(mapping[window_id])
+        self._window_workspaces = window_workspaces
+
+        from . import engine
+
+        # Skip closed workspaces and i3's internal scratchpad workspace.
+        to_save = []
+        for name in sorted(workspaces):
+            ws = snapshot['by_name'].get(name)
+            if ws is not None and not name.startswith('__'):
+                to_save.append(str(ws['num']) if self.numeric else name)
+
+        def on_error(workspace, e):
+            util.eprint(f'Error saving workspace "{workspace}": {str(e)}')
+
+        with index.edit(self.directory) as session_index:
+            engine.save_workspaces(
+                to_save, self.numeric, self.directory, self.swallow_criteria,
+                self.target, snapshot, self._process_cache,
+                skip_unchanged=True, session_index=session_index,
+                jobs=self.jobs, i3=self._i3, on_error=on_error)
+
+        if self.metrics_file is not None:
+            try:
+                metrics.write_textfile(self.metrics_file)
+            except OSError as e:
+                util.eprint(f'Error writing metrics: {str(e)}')
+
+    def _on_window(self, i3, event):
+        if event.change in IGNORED_WINDOW_CHANGES:
+            return
+        self._mark_dirty(window_id=event.container.id)
+
+    def _on_workspace(self, i3, event):
+        if event.change in IGNORED_WORKSPACE_CHANGES:
+            return
+        for ws in [event.current, event.old]:
+            if ws is not None and ws.name is not None:
+                self._mark_dirty(workspace=ws.name)
+
+    def _mark_dirty(self, window_id=None, workspace=None):
+        with self._cond:
+            now = time.monotonic()
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+            if window_id is not None:
+                self._dirty_windows.add(window_id)
+            if workspace is not None:
+                self._dirty_workspaces.add(workspace)
+            self._cond.notify()
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while self._first_event is None:
+                    self._cond.wait()
+
+                # Wait for events to settle.
+                while True:
+                    due = min(self._last_event + self.delay,
+                              self._first_event + self.max_delay)
+                    remaining = due - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                window_ids = self._dirty_windows
+                workspaces = self._dirty_workspaces
+                self._dirty_windows = set()
+                self._dirty_workspaces = set()
+                self._first_event = None
+                self._last_event = None
+
+            try:
+                self.save(window_ids, workspaces)
+            except Exception as e:
+                util.eprint(f'Error saving workspaces: {str(e)}')
@@ -0,0 +1,103 @@
+"""
+Saves several workspaces side by side in one thread pool.
+
+Each workspace is walked, its window PIDs looked up and its files written by
+one task in the pool, so that one workspace's files are being written while
+the processes of the next one are read. The processes a workspace needs are
+read in the same pool. At most `jobs` workspaces are in flight at a time,
+which always leaves `jobs` threads free for those reads.
+"""
+import threading
+
+from . import bundle
+from . import ipc
+from . import layout
+from . import programs
+from . import treeutils
+from . import util
+
+
+def save_workspaces(workspaces, numeric, directory, swallow_criteria,
+                    target=None, snapshot=None, cache=None,
+                    skip_unchanged=False, session_index=None, jobs=4,
+                    i3=None, on_error=None):
+    """
+    Save the layouts and programs of several workspaces at once.
+
+    Args:
+        workspaces: The names or numbers of the workspaces to save.
+        numeric: Identify the workspaces by number instead of name.
+        directory: The directory to save the workspaces to.
+        swallow_criteria: The swallow criteria to use for the layouts.
+        target: 'layout_only', 'programs_only' or None to save both.
+        snapshot: Tree snapshot to take the workspaces from. [default: fetched
+            from i3 with only these workspaces decoded]
+        cache: ProcessCache to share process information between
+            workspaces.
+        skip_unchanged: Leave files whose content hasn't changed alone.
+        session_index: Index of the directory (see index.edit) to record the
+            saved workspaces in.
+        jobs: The number of workspaces to save at the same time.
+        i3: The ipc.Context to fetch the tree with. Defaults to the shared
+            one.
+        on_error: Function called with the workspace and the exception when
+            saving a workspace fails. [default: the exception is raised]
+    """
+    if snapshot is None:
+        snapshot = treeutils.get_tree_snapshot(i3 or ipc.get(), workspaces,
+                                               numeric)
+    if cache is None:
+        cache = programs.ProcessCache()
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    def save_workspace(workspace, executor):
+        # Every workspace records itself in its own index, which is merged
+        # into the session index in order so that the index stays stable.
+        workspace_index = {'workspaces': {}}
+        if target != 'programs_only':
+            layout.save(workspace, numeric, directory, swallow_criteria,
+                        snapshot, skip_unchanged, workspace_index)
+        if target != 'layout_only':
+            programs.save(workspace, numeric, directory, snapshot, cache,
+                          skip_unchanged, workspace_index, executor)
+        return workspace_index
+
+    # A workspace waits for its processes to be read in the same pool, so
+    # only half of the threads may be taken by workspaces.
+    slots = threading.BoundedSemaphore(jobs)
+    futures = []
+    with ThreadPoolExecutor(max_workers=jobs * 2) as executor:
+        for workspace in workspaces:
+            slots.acquire()
+            future = executor.submit(save_workspace, workspace, executor)
+            future.add_done_callback(lambda _: slots.release())
+            futures.append((workspace, future))
+
+        workspace_indexes = []
+        for workspace, future in futures:
+            try:
+                workspace_indexes.append(future.result())
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(workspace, e)
+                workspace_indexes.append(None)
+
+    saved = [
+        util.filename_filter(str(workspace))
+        for workspace, workspace_index in zip(workspaces, workspace_indexes)
+        if workspace_index is not None
+    ]
+    # Every saved part has a single copy, so that restoring a workspace or
+    # the session always finds the newest one.
+    bundle.remove(bundle.get_path(directory), saved,
+                  bundle.target_part(target))
+
+    if session_index is not None:
+        for workspace_index in workspace_indexes:
+            if workspace_index is None:
+                continue
+            for workspace_id, entry in workspace_index['workspaces'].items():
+                session_index['workspaces'].setdefault(
+                    workspace_id, {}).update(entry)
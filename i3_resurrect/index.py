@@ -0,0 +1,280 @@
+"""
+Index of the saved workspaces in a save directory.
+
+Every save directory has a small index file which is updated whenever
+workspaces are saved or removed, so that they can be listed without scanning
+the directory and parsing the saved files:
+
+    {
+      "version": 1,
+      "profiles": ["work"],
+      "workspaces": {
+        "1": {
+          "name": "1",
+          "layout": {"saved": 1600000000, "size": 1234, "windows": 3,
+                     "bundle": false},
+          "programs": {...}
+        }
+      }
+    }
+
+Profiles are the subdirectories of a save directory, each with its own index.
+"""
+import contextlib
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+
+from . import bundle
+from . import metrics
+from . import util
+
+INDEX_FILENAME = 'index.json'
+
+PARTS = ['layout', 'programs']
+
+_VERSION = 1
+
+_LOCK_FILENAME = '.index.lock'
+
+
+def get_path(directory):
+    """
+    Get the path of the index of a save directory.
+    """
+    return Path(directory) / INDEX_FILENAME
+
+
+def read(directory):
+    """
+    Read the index of a save directory.
+
+    If the directory has no index yet, e.g. because it was saved by an older
+    version, it is built from the saved files once and written.
+
+    Returns:
+        The index dict, which is empty if the directory doesn't exist.
+    """
+    try:
+        index = json.loads(get_path(directory).read_text())
+        if index.get('version') == _VERSION:
+            return index
+    except FileNotFoundError:
+        if not Path(directory).is_dir():
+            return _empty()
+    except ValueError:
+        pass
+
+    try:
+        # Opening the index for editing builds it.
+        with edit(directory) as index:
+            pass
+        return index
+    except OSError:
+        # The directory is read only.
+        return rebuild(directory)
+
+
+@contextlib.contextmanager
+def edit(directory):
+    """
+    Context manager which locks the index of a save directory and writes it
+    back when the block is done with it.
+
+    Yields:
+        The index dict to change.
+    """
+    directory = Path(directory)
+    with (directory / _LOCK_FILENAME).open('a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            try:
+                index = json.loads(get_path(directory).read_text())
+                if index.get('version') != _VERSION:
+                    index = rebuild(directory)
+            except (FileNotFoundError, ValueError):
+                index = rebuild(directory)
+            yield index
+            util.write_atomic(get_path(directory),
+                              json.dumps(index, indent=2), True)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def set_entry(index, workspace_id, part, data, size, bundled=False,
+              saved=None):
+    """
+    Record a saved part of a workspace in an index.
+
+    Args:
+        index: The index dict.
+        workspace_id: The id the workspace was saved under.
+        part: Either 'layout' or 'programs'.
+        data: The saved layout or programs.
+        size: The size of the saved data in bytes.
+        bundled: Whether the workspace was saved to the session bundle.
+        saved: The time it was saved at in seconds since the epoch.
+            [default: now]
+    """
+    entry = index['workspaces'].setdefault(workspace_id, {})
+    if part == 'layout' and data and 'name' in data:
+        entry['name'] = data['name']
+    entry[part] = {
+        'saved': int(time.time() if saved is None else saved),
+        'size': size,
+        'windows': count_windows(part, data),
+        'bundle': bundled,
+    }
+
+
+def write_part(directory, workspace, part, data, skip_unchanged=False,
+               index=None):
+    """
+    Write a saved part of a workspace to its file in a save directory.
+
+    Args:
+        directory: The save directory.
+        workspace: The name or number of the workspace.
+        part: Either 'layout' or 'programs'.
+        data: The saved layout or programs.
+        skip_unchanged: Leave the file alone if its content hasn't changed.
+        index: The index dict of the directory (see edit) to record the
+            saved part in.
+
+    Returns:
+        Whether the file was written.
+    """
+    workspace_id = util.filename_filter(workspace)
+    path = Path(directory) / f'workspace_{workspace_id}_{part}.json'
+    text = json.dumps(data, indent=2)
+    size = len(text.encode('utf-8'))
+    written = util.write_atomic(path, text, skip_unchanged)
+    metrics.WORKSPACE_WINDOWS.observe(count_windows(part, data), part=part)
+    if written:
+        metrics.WRITTEN_BYTES.inc(size, part=part)
+    else:
+        metrics.SKIPPED_WRITES.inc(part=part)
+    if written and index is not None:
+        set_entry(index, workspace_id, part, data, size)
+    return written
+
+
+def remove_entries(index, workspace_ids=None, part=None):
+    """
+    Remove saved workspaces from an index.
+
+    Args:
+        index: The index dict.
+        workspace_ids: The workspaces to remove, or None for all of them.
+        part: Only remove this part ('layout' or 'programs') of the
+            workspaces.
+    """
+    workspaces = index['workspaces']
+    for workspace_id in list(workspaces):
+        if workspace_ids is not None and workspace_id not in workspace_ids:
+            continue
+        if part is not None:
+            workspaces[workspace_id].pop(part, None)
+            if any(p in workspaces[workspace_id] for p in PARTS):
+                continue
+        del workspaces[workspace_id]
+
+
+def add_profile(directory, profile):
+    """
+    Record a profile in the index of its parent save directory.
+    """
+    with edit(directory) as index:
+        if profile not in index['profiles']:
+            index['profiles'] = sorted(index['profiles'] + [profile])
+
+
+def remove_profile(directory, profile):
+    """
+    Remove a profile from the index of its parent save directory.
+    """
+    with edit(directory) as index:
+        if profile in index['profiles']:
+            index['profiles'].remove(profile)
+
+
+def discard(directory):
+    """
+    Delete the index of a save directory, e.g. before deleting the directory.
+    """
+    for filename in [INDEX_FILENAME, _LOCK_FILENAME]:
+        try:
+            (Path(directory) / filename).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def count_windows(part, data):
+    """
+    Count the windows in a saved layout or list of programs.
+    """
+    if not data:
+        return 0
+    if part == 'programs':
+        return len(data)
+
+    windows = 0
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if node.get('swallows'):
+            windows += 1
+        stack.extend(node.get('nodes', []))
+        stack.extend(node.get('floating_nodes', []))
+    return windows
+
+
+def rebuild(directory):
+    """
+    Build the index of a save directory by reading every saved file in it.
+    """
+    directory = Path(directory)
+    index = _empty()
+    if not directory.is_dir():
+        return index
+
+    bundle_path = bundle.get_path(directory)
+    if bundle_path.is_file():
+        try:
+            header, workspaces = bundle.load(bundle_path)
+            saved = int(bundle_path.stat().st_mtime)
+            for workspace_id, workspace in workspaces.items():
+                for part in PARTS:
+                    if part in workspace:
+                        _, size = header['workspaces'][workspace_id][part]
+                        set_entry(index, workspace_id, part, workspace[part],
+                                  size, True, saved)
+        except ValueError:
+            pass
+
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if entry.is_dir():
+            index['profiles'].append(entry.name)
+            continue
+        name = entry.name
+        if not (name.startswith('workspace_') and name.endswith('.json')):
+            continue
+        stem = name[len('workspace_'):-len('.json')]
+        workspace_id, _, part = stem.rpartition('_')
+        if part not in PARTS:
+            continue
+        try:
+            data = json.loads(Path(entry.path).read_text())
+        except ValueError:
+            continue
+        stat = entry.stat()
+        set_entry(index, workspace_id, part, data, stat.st_size,
+                  saved=stat.st_mtime)
+
+    return index
+
+
+def _empty():
+    return {'version': _VERSION, 'profiles': [], 'workspaces': {}}
@@ -0,0 +1,170 @@
+"""
+Lazy-initialized i3 connection shared by everything a command does.
+
+i3ipc is only imported once a connection is needed, which keeps it out of
+commands like ls and rm.
+"""
+import json
+
+from . import timing
+
+
+class Context:
+    """
+    Wrapper around a single i3ipc connection.
+
+    Trees are fetched as plain JSON data without building i3ipc container
+    objects, and several independent commands can be sent in one message.
+    """
+
+    def __init__(self, connection=None, auto_reconnect=False):
+        self._connection = connection
+        # Whether a connection opened by the context reconnects when i3
+        # restarts.
+        self.auto_reconnect = auto_reconnect
+
+    @property
+    def connection(self):
+        """
+        The underlying i3ipc connection, which is opened on first use.
+        """
+        if self._connection is None:
+            import i3ipc
+
+            self._connection = i3ipc.Connection(
+                auto_reconnect=self.auto_reconnect)
+        return self._connection
+
+    def get_tree(self):
+        """
+        Get the whole layout tree as plain JSON data.
+        """
+        return json.loads(self.get_raw_tree())
+
+    @timing.timed('i3.get_tree')
+    def get_raw_tree(self):
+        """
+        Get the whole layout tree as the JSON text sent by i3.
+        """
+        from i3ipc.connection import MessageType
+
+        # i3ipc has no public way to get the raw reply, and building its
+        # container objects for the whole tree is wasted work here. The
+        # package doesn't export MessageType, so it is taken from the module
+        # Connection._message() is defined in.
+        return self.connection._message(MessageType.GET_TREE, '')
+
+    @timing.timed('i3.get_workspaces')
+    def get_workspaces(self):
+        """
+        Get the list of workspaces.
+        """
+        return self.connection.get_workspaces()
+
+    def get_focused_workspace(self):
+        """
+        Get the focused workspace.
+        """
+        for workspace in self.get_workspaces():
+            if workspace.focused:
+                return workspace
+        return None
+
+    @timing.timed('i3.command')
+    def command(self, *commands):
+        """
+        Send one or more commands to i3 in a single message.
+
+        Args:
+            commands: The commands to run, in order. Criteria don't carry over
+                from one command to the next.
+
+        Returns:
+            The list of command replies.
+        """
+        commands = [command for command in commands if command]
+        if not commands:
+            return []
+        return self.connection.command('; '.join(commands))
+
+    def batch(self):
+        """
+        Start a new CommandBatch on this connection.
+        """
+        return CommandBatch(self)
+
+
+class CommandBatch:
+    """
+    Collects commands and sends them to i3 in as few messages as possible.
+
+    Commands are added in groups, each of which belongs to one item (e.g. a
+    program being launched), and the replies are matched back to the groups so
+    that failures can be reported per item.
+    """
+
+    def __init__(self, i3):
+        self._i3 = i3
+        self._groups = []
+
+    def __len__(self):
+        return len(self._groups)
+
+    def add(self, item, *commands):
+        """
+        Add a group of commands.
+
+        Args:
+            item: The item the commands belong to.
+            commands: The commands, each of which i3 replies to separately.
+        """
+        commands = [command for command in commands if command]
+        if commands:
+            self._groups.append((item, commands))
+
+    def send(self):
+        """
+        Send every added command.
+
+        i3 stops running a message at the first command it can't parse, so the
+        groups after a failing one are sent again in a new message.
+
+        Returns:
+            A list of (item, error) tuples, one for each group, where error is
+            None if every command of the group succeeded.
+        """
+        results = []
+        groups = self._groups
+        self._groups = []
+        while groups:
+            replies = self._i3.command(
+                *[command for _, commands in groups for command in commands])
+            for sent, (item, commands) in enumerate(groups, 1):
+                group_replies = replies[:len(commands)]
+                replies = replies[len(commands):]
+                error = None
+                for reply in group_replies:
+                    if not reply.success:
+                        error = reply.error or 'command failed'
+                        break
+                if error is None and len(group_replies) < len(commands):
+                    error = 'command was not run'
+                results.append((item, error))
+                if not replies:
+                    break
+            groups = groups[sent:]
+        return results
+
+
+def get():
+    """
+    Get the shared context.
+    """
+    global _context
+
+    if _context is None:
+        _context = Context()
+    return _context
+
+
+_context = None
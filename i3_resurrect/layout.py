@@ -1,14 +1,18 @@
 import json
-import shlex
-import subprocess
+import os
 import sys
 import tempfile
+import time
 from pathlib import Path
 
-import i3ipc
-
+from . import bundle
+from . import index
+from . import ipc
+from . import metrics
+from . import timing
 from . import treeutils
 from . import util
+from . import x11
 
 
 def list(i3, numeric):
@@ -23,30 +27,52 @@ def list(i3, numeric):
             workspaces.append(workspace_data.name)
     return workspaces
 
-def save(workspace, numeric, directory, swallow_criteria):
+def save(workspace, numeric, directory, swallow_criteria, snapshot=None,
+         skip_unchanged=False, session_index=None):
     """
     Save an i3 workspace layout to a file.
+
+    If a tree snapshot is given, the workspace is taken from it instead of
+    fetching the tree from i3 again. If the index of the directory is given
+    (see index.edit), the saved layout is recorded in it.
+
+    Returns:
+        False if the file was left alone because skip_unchanged was set and
+        the layout hasn't changed, otherwise True.
     """
-    workspace_id = util.filename_filter(workspace)
-    filename = f'workspace_{workspace_id}_layout.json'
-    layout_file = Path(directory) / filename
+    start = time.perf_counter()
+    # Build new workspace tree suitable for restoring and write it to a file.
+    workspace_layout = get_workspace_layout(workspace, numeric,
+                                            swallow_criteria, snapshot)
+    written = index.write_part(directory, workspace, 'layout',
+                               workspace_layout, skip_unchanged,
+                               session_index)
+    metrics.SAVE_DURATION.observe(time.perf_counter() - start, part='layout')
+    return written
 
-    workspace_tree = treeutils.get_workspace_tree(workspace, numeric)
 
-    with layout_file.open('w') as f:
-        # Build new workspace tree suitable for restoring and write it to a
-        # file.
-        f.write(
-            json.dumps(
-                build_layout(workspace_tree, swallow_criteria),
-                indent=2,
-            )
-        )
+def get_workspace_layout(workspace, numeric, swallow_criteria, snapshot=None):
+    """
+    Get the restorable layout of an i3 workspace.
+
+    Args:
+        workspace: The name or number of the workspace.
+        numeric: Identify workspace by number instead of name.
+        swallow_criteria: The swallow criteria to use.
+        snapshot: Optional tree snapshot to look the workspace up in.
+    """
+    # The windows found on the way are kept in the snapshot for saving the
+    # programs.
+    return treeutils.process_workspace(workspace, numeric, swallow_criteria,
+                                       snapshot)[0]
 
 
 def read(workspace, directory):
     """
     Read saved layout file.
+
+    Falls back to the session bundle if there is no layout file for the
+    workspace.
     """
     workspace_id = util.filename_filter(workspace)
     filename = f'workspace_{workspace_id}_layout.json'
@@ -56,22 +82,38 @@ def read(workspace, directory):
     try:
         layout = json.loads(layout_file.read_text())
     except FileNotFoundError:
-        util.eprint('Could not find saved layout for workspace '
+        layout = bundle.read_workspace(bundle.get_path(directory),
+                                       workspace_id, 'layout')
+        if layout is None:
+            util.eprint('Could not find saved layout for workspace '
                         f'"{workspace}"')
     return layout
 
 
-def restore(workspace_name, layout):
+@timing.timed('layout.restore')
+def restore(workspace_name, layout, layout_file=None, i3=None):
     """
     Restore an i3 workspace layout.
+
+    Args:
+        workspace_name: The name of the workspace to restore.
+        layout: The saved layout.
+        layout_file: Optional LayoutFile to hand the layout to i3 with, so
+            that one file can be reused for several workspaces.
+        i3: The ipc.Context to use. Defaults to the shared one.
     """
     if layout == {}:
         return
+    if i3 is None:
+        i3 = ipc.get()
     window_ids = []
     placeholder_window_ids = []
 
-    # Get ids of all placeholder or normal windows in workspace.
-    ws = treeutils.get_workspace_tree(workspace_name, False)
+    # Get ids of all placeholder or normal windows in workspace. Only this
+    # workspace and the focused one are needed from the tree.
+    focused = i3.get_focused_workspace()
+    snapshot = treeutils.get_tree_snapshot(i3, [workspace_name, focused.name])
+    ws = treeutils.get_workspace_tree(workspace_name, False, snapshot)
     windows = treeutils.get_leaves(ws)
     for con in windows:
         window_id = con['window']
@@ -84,43 +126,46 @@ def restore(workspace_name, layout):
             window_ids.append(window_id)
 
     # Unmap all non-placeholder windows in workspace.
-    for window_id in window_ids:
-        xdo_unmap_window(window_id)
+    x11.unmap_windows(window_ids)
 
     # Remove any remaining placeholder windows in workspace so that we don't
     # have duplicates.
-    for window_id in placeholder_window_ids:
-        xdo_kill_window(window_id)
+    x11.kill_windows(placeholder_window_ids)
 
     try:
-        i3 = i3ipc.Connection()
-
         # append_layout can only insert nodes so we must separately change the
         # layout mode of the workspace node.
         ws_layout_mode = layout.get('layout', 'default')
-        tree = i3.get_tree()
-        focused = tree.find_focused()
-        workspace_node = focused.workspace()
-        workspace_node.command(f'layout {ws_layout_mode}')
+        workspace_node = treeutils.get_workspace_tree(focused.name, False,
+                                                      snapshot)
+        layout_command = (
+            f'[con_id={workspace_node["id"]}] layout {ws_layout_mode}')
 
         # We don't want to pass the whole layout file because we don't want to
         # append a new workspace. append_layout requires a file path so we must
-        # extract the part of the json that we want and store it in a tempfile.
-        restorable_layout = (
+        # extract the part of the json that we want and hand it over in a
+        # file which lives in memory.
+        restorable_layout = json.dumps((
             layout.get('nodes', []) + layout.get('floating_nodes', []),
-        )
-        restorable_layout_file = tempfile.NamedTemporaryFile(
-            mode='w',
-            prefix='i3-resurrect_',
-        )
-        restorable_layout_file.write(json.dumps(restorable_layout))
-        restorable_layout_file.flush()
-
-        # Create fresh placeholder windows by appending layout to workspace.
-        i3.command(f'append_layout {restorable_layout_file.name}')
-
-        # Delete tempfile.
-        restorable_layout_file.close()
+        ))
+        own_layout_file = layout_file is None
+        if own_layout_file:
+            layout_file = LayoutFile()
+        try:
+            # Create fresh placeholder windows by appending layout to
+            # workspace.
+            layout_file.write(restorable_layout)
+            replies = i3.command(layout_command,
+                                 f'append_layout {layout_file.path}')
+            if (replies and not replies[-1].success
+                    and layout_file.path in (replies[-1].error or '')
+                    and layout_file.use_runtime_dir()):
+                # i3 couldn't read the memfd, so try again with a file.
+                layout_file.write(restorable_layout)
+                i3.command(f'append_layout {layout_file.path}')
+        finally:
+            if own_layout_file:
+                layout_file.close()
     except Exception as e:
         util.eprint('Error occurred restoring workspace layout. Note that if '
                     'the layout was saved by a version prior to 1.4.0 it must '
@@ -129,8 +174,86 @@ def restore(workspace_name, layout):
     finally:
         # Map all unmapped windows. We use finally because we don't want the
         # user to lose their windows no matter what.
-        for window_id in window_ids:
-            xdo_map_window(window_id)
+        x11.map_windows(window_ids)
+
+
+class LayoutFile:
+    """
+    A reusable file for handing layouts to i3's append_layout command without
+    touching persistent storage.
+
+    The layout is kept in a memfd which i3 opens through /proc. If memfds
+    aren't available, a file in $XDG_RUNTIME_DIR (normally a tmpfs) is used
+    instead, or in the system temp directory as a last resort. Each write
+    replaces the previous content, so one file can serve a whole batch of
+    workspaces.
+    """
+
+    def __init__(self):
+        self.path = None
+        self._fd = None
+        self._memfd = False
+        if hasattr(os, 'memfd_create'):
+            try:
+                self._fd = os.memfd_create('i3-resurrect_layout')
+                # i3 opens the path itself, so /proc/self can't be used.
+                self.path = f'/proc/{os.getpid()}/fd/{self._fd}'
+                self._memfd = True
+            except OSError:
+                pass
+        if self._fd is None:
+            self.use_runtime_dir()
+
+    def use_runtime_dir(self):
+        """
+        Switch from a memfd to a file in the runtime directory.
+
+        Returns:
+            False if a file is already in use, otherwise True.
+        """
+        if self._fd is not None and not self._memfd:
+            return False
+        self.close()
+
+        directory = os.environ.get('XDG_RUNTIME_DIR')
+        if not directory or not os.path.isdir(directory):
+            directory = None
+        self._fd, self.path = tempfile.mkstemp(prefix='i3-resurrect_',
+                                               suffix='.json', dir=directory)
+        self._memfd = False
+        return True
+
+    def write(self, data):
+        """
+        Replace the content of the file.
+        """
+        data = data.encode('utf-8')
+        os.ftruncate(self._fd, 0)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self._fd, view):]
+
+    def close(self):
+        """
+        Close the file and remove it if it isn't a memfd.
+        """
+        if self._fd is None:
+            return
+        os.close(self._fd)
+        if not self._memfd:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self._fd = None
+        self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 def build_layout(tree, swallow):
@@ -151,29 +274,3 @@ def is_placeholder(container):
     """
     return container['swallows'] not in [[], None]
 
-
-def xdo_unmap_window(window_id):
-    command = shlex.split(f'xdotool windowunmap {window_id}')
-    subprocess.call(
-        command,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-    )
-
-
-def xdo_map_window(window_id):
-    command = shlex.split(f'xdotool windowmap {window_id}')
-    subprocess.call(
-        command,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-    )
-
-
-def xdo_kill_window(window_id):
-    command = shlex.split(f'xdotool windowkill {window_id}')
-    subprocess.call(
-        command,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.STDOUT,
-    )
@@ -1,19 +1,43 @@
 import json
+import shlex
+import signal
 import sys
 import os
 import time
 from pathlib import Path
 
 import click
-import i3ipc
-from natsort import natsorted
 
+from . import bundle
+from . import daemon
+from . import index
+from . import ipc
 from . import layout
+from . import metrics
 from . import programs
+from . import server
+from . import swallow
+from . import timing
+from . import treeutils
 from . import util
 
 
-@click.group(context_settings=dict(help_option_names=['-h', '--help'],
+class Group(click.Group):
+    """
+    Command group which hands commands to a running server if there is one.
+    """
+
+    def parse_args(self, ctx, args):
+        if (args and args[0] in server.FORWARDED_COMMANDS
+                and not server.serving()):
+            exit_code = server.forward(args)
+            if exit_code is not None:
+                ctx.exit(exit_code)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=Group,
+             context_settings=dict(help_option_names=['-h', '--help'],
                                    max_content_width=150))
 @click.version_option()
 def main():
@@ -46,6 +70,36 @@ def main():
               help=('The swallow criteria to use.\n'
                     '[options: class,instance,title,window_role]\n'
                     '[default: class,instance]'))
+@click.option('--skip-unchanged',
+              is_flag=True,
+              help="Don't rewrite saved files whose content hasn't changed.\n")
+@click.option('--jobs', '-j',
+              type=click.IntRange(min=1),
+              default=4,
+              help=('The number of workspaces to save and processes to '
+                    'inspect in parallel.\n'
+                    '[default: 4]'))
+@click.option('--bundle', '-b', 'use_bundle',
+              is_flag=True,
+              help=('Save to a single session bundle file instead of one '
+                    'layout and one programs file per workspace.\n'))
+@click.option('--bundle-format',
+              type=click.Choice(bundle.FORMATS),
+              default='json',
+              help=('The encoding of the session bundle.\n'
+                    '[default: json]'))
+@click.option('--compression',
+              type=click.Choice(bundle.COMPRESSIONS),
+              default='none',
+              help=('The compression of the session bundle.\n'
+                    '[default: none]'))
+@click.option('--timings',
+              is_flag=True,
+              help='Print how long each phase took.\n')
+@click.option('--trace',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=('Write the timed phases to this file as a Chrome trace.'))
 @click.option('--layout-only', 'target',
               flag_value='layout_only',
               help='Only save layout.')
@@ -53,26 +107,34 @@ def main():
               flag_value='programs_only',
               help='Only save running programs.')
 @click.argument('workspaces', nargs=-1, default=None)
-def save_workspace(workspace, numeric, session, directory, profile, clear, swallow, target, workspaces):
+def save_workspace(workspace, numeric, session, directory, profile, clear, swallow, skip_unchanged, jobs, use_bundle, bundle_format, compression, timings, trace, target, workspaces):
     """
     Save i3 workspace(s) layout(s) or whole session and running programs to a file.
 
     WORKSPACES are the workspaces to save.
     [default: current workspace]
     """
-    i3 = i3ipc.Connection()
+    record_timings(timings, trace)
+    i3 = ipc.get()
     if not workspaces:
         # set default value
-        workspaces = ( i3.get_tree().find_focused().workspace().name, )
+        workspaces = ( i3.get_focused_workspace().name, )
 
     if profile is not None:
+        Path(directory, profile).mkdir(parents=True, exist_ok=True)
+        index.add_profile(directory, profile)
         directory = Path(directory) / profile
 
     # Create directory if non-existent.
     Path(directory).mkdir(parents=True, exist_ok=True)
 
-    if target != 'programs_only':
-        swallow_criteria = swallow.split(',')
+    if use_bundle:
+        missing = bundle.unavailable(bundle_format, compression)
+        if missing is not None:
+            util.eprint(f'The {missing} module is required for '
+                        f'--bundle-format={bundle_format} '
+                        f'--compression={compression}.')
+            sys.exit(1)
 
     if clear and os.path.isdir(directory):
         # Clear previous layout files before saving in current profile
@@ -84,17 +146,115 @@ def save_workspace(workspace, numeric, session, directory, profile, clear, swall
         util.eprint('Either --workspace or --session should be specified.')
         sys.exit(1)
 
-    for workspace_id in workspaces:
-        if target != 'programs_only':
-            # Save workspace layout to file.
-            layout.save(workspace_id, numeric, directory, swallow_criteria)
+    # Read each process only once, even if it owns windows on several
+    # workspaces (or, in the server, during several saves).
+    cache = programs.get_process_cache()
+    cache.jobs = jobs
+    cache.begin_run()
+
+    if use_bundle:
+        # Take a single snapshot of the tree so that every workspace is saved
+        # from the same point in time without fetching the tree again for each
+        # one. Unless the whole session is saved, only the requested
+        # workspaces are decoded from it.
+        if session:
+            snapshot = treeutils.get_tree_snapshot(i3)
+        else:
+            snapshot = treeutils.get_tree_snapshot(i3, workspaces, numeric)
+        save_bundle(directory, workspaces, numeric, swallow, target, snapshot,
+                    cache, bundle_format, compression, skip_unchanged)
+        return
+
+    # The engine takes the snapshot over the same connection and saves the
+    # workspaces side by side.
+    from . import engine
 
-        if target != 'layout_only':
-            # Save running programs to file.
-            programs.save(workspace_id, numeric, directory)
+    with index.edit(directory) as session_index:
+        engine.save_workspaces(
+            workspaces, numeric, directory, swallow.split(','), target,
+            cache=cache, skip_unchanged=skip_unchanged,
+            session_index=session_index, jobs=jobs, i3=i3)
 
 
-def restore_workspace(i3, saved_layout, saved_programs, target, clear):
+def save_bundle(directory, workspaces, numeric, swallow, target, snapshot,
+                cache, bundle_format, compression, skip_unchanged=False):
+    """
+    Save workspaces to the session bundle in a directory.
+
+    Workspaces which are already in the bundle and aren't being saved are
+    kept. The files the saved workspaces had of their own are removed.
+    """
+    bundle_path = bundle.get_path(directory)
+    saved_workspaces = {}
+    if bundle_path.is_file():
+        _, saved_workspaces = bundle.load(bundle_path)
+
+    workspace_ids = [
+        util.filename_filter(str(workspace_id)) for workspace_id in workspaces
+    ]
+    parts = [
+        part for part in bundle.PARTS
+        if target is None or part == bundle.target_part(target)
+    ]
+    for workspace_id, saved_id in zip(workspaces, workspace_ids):
+        saved = saved_workspaces.setdefault(saved_id, {})
+        if 'layout' in parts:
+            start = time.perf_counter()
+            saved['layout'] = layout.get_workspace_layout(
+                workspace_id, numeric, swallow.split(','), snapshot)
+            metrics.SAVE_DURATION.observe(time.perf_counter() - start,
+                                          part='layout')
+        if 'programs' in parts:
+            start = time.perf_counter()
+            saved['programs'] = programs.get_programs(workspace_id, numeric,
+                                                      snapshot, cache)
+            metrics.SAVE_DURATION.observe(time.perf_counter() - start,
+                                          part='programs')
+
+    # Every saved part has a single copy, so the workspaces' own files are
+    # removed.
+    removed = False
+    for saved_id in workspace_ids:
+        for part in parts:
+            try:
+                (Path(directory) /
+                 f'workspace_{saved_id}_{part}.json').unlink()
+                removed = True
+            except FileNotFoundError:
+                pass
+
+    written = bundle.write(bundle_path, saved_workspaces, bundle_format,
+                           compression, skip_unchanged)
+    header = bundle.read_header(bundle_path) if written else None
+    # The saved parts are counted like the files of a save without --bundle,
+    # with the size of their records in the bundle.
+    for saved_id in workspace_ids:
+        for part in parts:
+            data = saved_workspaces[saved_id][part]
+            metrics.WORKSPACE_WINDOWS.observe(index.count_windows(part, data),
+                                              part=part)
+            if written:
+                _, size = header['workspaces'][saved_id][part]
+                metrics.WRITTEN_BYTES.inc(size, part=part)
+            else:
+                metrics.SKIPPED_WRITES.inc(part=part)
+    if not (written or removed):
+        return
+
+    if header is None:
+        header = bundle.read_header(bundle_path)
+    with index.edit(directory) as session_index:
+        for saved_id in workspace_ids:
+            entry = header['workspaces'][saved_id]
+            for part in parts:
+                _, size = entry[part]
+                index.set_entry(session_index, saved_id, part,
+                                saved_workspaces[saved_id][part], size,
+                                bundled=True)
+
+
+def restore_workspace(i3, saved_layout, saved_programs, target, clear,
+                      tracker=None):
     if saved_layout == None:
         return
 
@@ -109,11 +269,147 @@ def restore_workspace(i3, saved_layout, saved_programs, target, clear):
 
     if target != 'programs_only':
         # Load workspace layout.
-        layout.restore(workspace_name, saved_layout)
+        layout.restore(workspace_name, saved_layout, i3=i3)
 
     if target != 'layout_only':
         # Restore programs.
-        programs.restore(workspace_name, saved_programs, clear)
+        launched = programs.restore(workspace_name, saved_programs, clear,
+                                    i3=i3)
+        if tracker is not None:
+            tracker.expect_programs(
+                saved_layout if target != 'programs_only' else None,
+                launched,
+            )
+
+
+def restore_session(i3, saved_workspaces, target, clear, jobs, tracker=None):
+    """
+    Restore several workspaces.
+
+    The placeholder layouts of all workspaces are built first. Then the
+    programs of every workspace are launched in parallel by a bounded pool of
+    workers. Their windows are swallowed by the placeholders, so the focus
+    doesn't have to move between workspaces while the programs start.
+
+    Args:
+        i3: The ipc.Context to use.
+        saved_workspaces: List of (saved_layout, saved_programs) tuples.
+        target: Either 'layout_only', 'programs_only' or None for both.
+        clear: Close running programs which are not part of the workspaces.
+        jobs: The maximum number of workspaces to restore programs for at
+            once.
+        tracker: Optional SwallowTracker which is told about the windows of
+            the launched programs.
+    """
+    if target == 'programs_only':
+        # Without placeholders new windows open on the focused workspace, so
+        # each workspace has to be focused in turn.
+        for saved_layout, saved_programs in saved_workspaces:
+            restore_workspace(i3, saved_layout, saved_programs, target, clear,
+                              tracker)
+        return
+
+    workspaces = []
+    # Hand every layout to i3 through the same in-memory file.
+    with layout.LayoutFile() as layout_file:
+        for saved_layout, saved_programs in saved_workspaces:
+            if saved_layout == None:
+                continue
+
+            # Get layout name from file.
+            if 'name' in saved_layout:
+                workspace_name = saved_layout['name']
+            else:
+                util.eprint('Workspace name not found.')
+                sys.exit(1)
+
+            # append_layout works on the focused workspace, so layouts have to
+            # be restored one after another.
+            i3.command(f'workspace --no-auto-back-and-forth {workspace_name}')
+            layout.restore(workspace_name, saved_layout, layout_file, i3)
+            workspaces.append((workspace_name, saved_layout, saved_programs))
+
+    if target == 'layout_only' or not workspaces:
+        return
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Find running programs in all workspaces from one tree snapshot.
+    snapshot = treeutils.get_tree_snapshot(
+        i3, [workspace_name for workspace_name, _, _ in workspaces])
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            (
+                saved_layout,
+                executor.submit(programs.restore, workspace_name,
+                                saved_programs, clear, snapshot,
+                                switch_workspace=False, i3=i3),
+            )
+            for workspace_name, saved_layout, saved_programs in workspaces
+        ]
+        for saved_layout, future in futures:
+            launched = future.result()
+            if tracker is not None:
+                tracker.expect_programs(saved_layout, launched)
+
+
+def print_diff(i3, saved_workspaces, clear):
+    """
+    Print which programs restoring workspaces would launch and close.
+
+    Args:
+        i3: The ipc.Context to use.
+        saved_workspaces: List of (saved_layout, saved_programs) tuples.
+        clear: Also print the running programs which would be closed.
+    """
+    snapshot = treeutils.get_tree_snapshot(i3, [
+        saved_layout.get('name') for saved_layout, _ in saved_workspaces
+        if saved_layout is not None
+    ])
+    for saved_layout, saved_programs in saved_workspaces:
+        if saved_layout is None or saved_programs is None:
+            continue
+        workspace_name = saved_layout.get('name')
+        running_programs = programs.get_programs(workspace_name, False,
+                                                 snapshot)
+        to_launch, to_kill = programs.diff(saved_programs, running_programs)
+
+        print(f'Workspace {workspace_name}:')
+        for program in to_launch:
+            print(f'  + {format_program(program)}')
+        if clear:
+            for program in to_kill:
+                print(f'  - {format_program(program)}')
+
+
+def record_timings(timings, trace):
+    """
+    Time the phases of the current command if --timings or --trace was given,
+    and report them once it has finished.
+    """
+    if not timings and trace is None:
+        return
+    timing.enable()
+
+    def report():
+        timing.disable()
+        if timings:
+            timing.print_summary()
+        if trace is not None:
+            timing.write_trace(trace)
+
+    click.get_current_context().call_on_close(report)
+
+
+def format_program(program):
+    """
+    Format a saved or running program for display.
+    """
+    command = program.get('command')
+    if isinstance(command, list):
+        command = ' '.join(shlex.quote(arg) for arg in command)
+    return f'{program.get("class")}: {command}'
 
 
 @main.command('restore')
@@ -141,6 +437,32 @@ def restore_workspace(i3, saved_layout, saved_programs, target, clear):
 @click.option('--focus', '-f',
               is_flag=True,
               help='Keep the focus on the current window.\n')
+@click.option('--jobs', '-j',
+              type=click.IntRange(min=1),
+              default=4,
+              help=('The number of workspaces to restore programs for in '
+                    'parallel.\n'
+                    '[default: 4]'))
+@click.option('--wait', '-W',
+              is_flag=True,
+              help='Wait until the restored programs have opened their windows.\n')
+@click.option('--timeout', '-t',
+              type=click.FloatRange(min=0),
+              default=10,
+              help=('The maximum number of seconds to wait for restored '
+                    'programs with --wait or --focus.\n'
+                    '[default: 10]'))
+@click.option('--dry-run',
+              is_flag=True,
+              help=('Only print which programs would be launched, and closed '
+                    'with --clear.\n'))
+@click.option('--timings',
+              is_flag=True,
+              help='Print how long each phase took.\n')
+@click.option('--trace',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=('Write the timed phases to this file as a Chrome trace.'))
 @click.option('--layout-only', 'target',
               flag_value='layout_only',
               help='Only restore layout.')
@@ -149,36 +471,56 @@ def restore_workspace(i3, saved_layout, saved_programs, target, clear):
               help='Only restore running programs.')
 @click.argument('workspaces', nargs=-1)
 def restore_workspaces(workspace, numeric, session, directory, profile, target,
-        clear, focus, workspaces):
+        clear, focus, jobs, wait, timeout, dry_run, timings, trace,
+        workspaces):
     """
     Restore i3 workspace(s) layout(s) or whole session and programs.
 
     WORKSPACES are the workspaces to restore.
     [default: current workspace]
     """
-    i3 = i3ipc.Connection()
+    record_timings(timings, trace)
+    i3 = ipc.get()
 
-    focused_workspace = i3.get_tree().find_focused().workspace().name
+    focused_workspace = i3.get_focused_workspace().name
 
     if not workspaces:
         if numeric:
-            workspaces = ( str(i3.get_tree().find_focused().workspace().num), )
+            workspaces = ( str(i3.get_focused_workspace().num), )
         else:
             workspaces = ( focused_workspace, )
 
     if profile is not None:
         directory = Path(directory) / profile
 
+    saved_workspaces = []
     if session:
         # Restore all workspaces from dir
+        saved_ids = set()
         files = util.list_filenames(directory)
         for layout_file, programs_file in files:
+            saved_ids.add(layout_file.name[len('workspace_'):
+                                           -len('_layout.json')])
             saved_layout = json.loads(layout_file.read_text())
             if target != 'layout_only':
                 saved_programs = json.loads(programs_file.read_text())
             else:
                 saved_programs = None
-            restore_workspace(i3, saved_layout, saved_programs, target, clear)
+            saved_workspaces.append((saved_layout, saved_programs))
+
+        # Then the workspaces which were saved to the session bundle. A
+        # workspace is only ever in one of them, as saving it to one removes
+        # it from the other.
+        bundle_path = bundle.get_path(directory)
+        if bundle_path.is_file():
+            _, bundled_workspaces = bundle.load(bundle_path)
+            for workspace_id, saved in bundled_workspaces.items():
+                if workspace_id in saved_ids:
+                    continue
+                saved_programs = None
+                if target != 'layout_only':
+                    saved_programs = saved.get('programs', [])
+                saved_workspaces.append((saved.get('layout'), saved_programs))
     elif workspace:
         for workspace_id in workspaces:
             if numeric and not workspace_id.isdigit():
@@ -189,14 +531,31 @@ def restore_workspaces(workspace, numeric, session, directory, profile, target,
                 saved_programs = programs.read(workspace_id, directory)
             else:
                 saved_programs = None
-            restore_workspace(i3, saved_layout, saved_programs, target, clear)
+            saved_workspaces.append((saved_layout, saved_programs))
     else:
         util.eprint('Either --workspace or --session should be specified.')
         sys.exit(1)
 
+    if dry_run:
+        print_diff(i3, saved_workspaces, clear)
+        return
+
+    tracker = None
+    if (focus or wait) and target != 'layout_only':
+        # Subscribe to new windows before any program is launched.
+        tracker = swallow.SwallowTracker()
+        if not tracker.start(i3):
+            tracker = None
+
+    restore_session(i3, saved_workspaces, target, clear, jobs, tracker)
+
+    if tracker is not None:
+        # Wait for the restored programs to open their windows.
+        if not tracker.wait(timeout):
+            util.eprint(f'Timed out waiting for {tracker.pending()} '
+                        'window(s) to appear.')
+
     if focus:
-        # WORKAROUND: Add time sleep for loading the latest restored programm.
-        time.sleep(3)
         i3.command(f'workspace --no-auto-back-and-forth {focused_workspace}')
 
 
@@ -235,7 +594,7 @@ def load_workspaces(workspace, numeric, directory, profile, target,
     WORKSPACE_LAYOUT is the workspace file to load.
     TARGET_WORKSPACE is the target workspace
     """
-    i3 = i3ipc.Connection()
+    i3 = ipc.get()
 
     if numeric:
         if not workspace_layout.isdigit():
@@ -243,12 +602,12 @@ def load_workspaces(workspace, numeric, directory, profile, target,
             sys.exit(1)
 
         if not target_workspace:
-            target_workspace = str(i3.get_tree().find_focused().workspace().num)
+            target_workspace = str(i3.get_focused_workspace().num)
         elif not target_workspace.isdigit():
             util.eprint('Invalid workspace number.')
             sys.exit(1)
     else:
-        target_workspace = i3.get_tree().find_focused().workspace().name
+        target_workspace = i3.get_focused_workspace().name
 
     if profile is not None:
         directory = Path(directory) / profile
@@ -275,11 +634,11 @@ def load_workspaces(workspace, numeric, directory, profile, target,
 
     if target != 'programs_only':
         # Load workspace layout.
-        layout.restore(target_workspace, saved_layout)
+        layout.restore(target_workspace, saved_layout, i3=i3)
 
     if target != 'layout_only':
         # Restore programs.
-        programs.restore(target_workspace, saved_programs, clear)
+        programs.restore(target_workspace, saved_programs, clear, i3=i3)
 
 
 @main.command('ls')
@@ -288,40 +647,70 @@ def load_workspaces(workspace, numeric, directory, profile, target,
               default=Path('~/.i3/i3-resurrect/').expanduser(),
               help=('The directory to search in.\n'
                     '[default: ~/.i3/i3-resurrect]'))
+@click.option('--profile', '-p',
+              default=None,
+              help=('The profile to list the workspaces of.'))
+@click.option('--all', '-a', 'all_profiles',
+              is_flag=True,
+              help='List the workspaces of every profile.\n')
+@click.option('--json', 'as_json',
+              is_flag=True,
+              help='Print machine-readable JSON.\n')
 @click.argument('item',
                 type=click.Choice(['workspaces', 'profiles']),
                 default='workspaces')
-def list_workspaces(directory, item):
+def list_workspaces(directory, profile, all_profiles, as_json, item):
     """
     List saved workspaces or profiles.
     """
-    # TODO: list workspaces in profiles
-    if item == 'workspaces':
-        directory = Path(directory)
-        workspaces = []
-        for entry in directory.iterdir():
-            if entry.is_file():
-                name = entry.name
-                name = name[name.index('_') + 1:]
-                workspace = name[:name.rfind('_')]
-                file_type = name[name.rfind('_') + 1:name.index('.json')]
-                workspaces.append(f'Workspace {workspace} {file_type}')
-        workspaces = natsorted(workspaces)
-        for workspace in workspaces:
-            print(workspace)
-    else:
-        directory = Path(directory)
-        profiles = []
-        try:
-            for entry in directory.iterdir():
-                if entry.is_dir():
-                    profile = entry.name
-                    profiles.append(f'Profile {profile}')
-            profiles = natsorted(profiles)
+    from natsort import natsorted
+
+    directory = Path(directory)
+    root_index = index.read(directory)
+
+    if item == 'profiles':
+        profiles = natsorted(root_index['profiles'])
+        if as_json:
+            print(json.dumps(profiles))
+        elif profiles:
             for profile in profiles:
-                print(profile)
-        except FileNotFoundError:
+                print(f'Profile {profile}')
+        else:
             print('No profiles found')
+        return
+
+    if all_profiles:
+        profiles = [None] + natsorted(root_index['profiles'])
+    else:
+        profiles = [profile]
+
+    entries = []
+    for profile in profiles:
+        if profile is None:
+            session_index = root_index
+        else:
+            session_index = index.read(directory / profile)
+        for workspace_id, saved in session_index['workspaces'].items():
+            for part in index.PARTS:
+                if part in saved:
+                    entries.append(dict(
+                        profile=profile,
+                        workspace=workspace_id,
+                        name=saved.get('name'),
+                        type=part,
+                        **saved[part],
+                    ))
+    entries = natsorted(
+        entries, key=lambda e: (e['profile'] or '', e['workspace'], e['type']))
+
+    if as_json:
+        print(json.dumps(entries, indent=2))
+        return
+    for entry in entries:
+        line = f'Workspace {entry["workspace"]} {entry["type"]}'
+        if all_profiles and entry['profile'] is not None:
+            line = f'Profile {entry["profile"]} {line}'
+        print(line)
 
 
 @main.command('rm')
@@ -355,28 +744,39 @@ def remove(workspace, session, directory, profile, target, workspaces):
 
     if session and os.path.isdir(directory):
         clear_directory(directory, target)
-        if profile is not None:
+        if profile is not None and target is None:
+            index.discard(directory)
             os.rmdir(directory)
+            index.remove_profile(directory.parent, profile)
     elif workspace:
+        workspace_ids = []
         for workspace_id in workspaces:
             workspace_id = util.filename_filter(workspace_id)
+            workspace_ids.append(workspace_id)
             programs_filename = f'workspace_{workspace_id}_programs.json'
             layout_filename = f'workspace_{workspace_id}_layout.json'
             programs_file = Path(directory) / programs_filename
             layout_file = Path(directory) / layout_filename
 
-            delete(layout_file, programs_file, target)
+            if programs_file.exists() or layout_file.exists():
+                delete(layout_file, programs_file, target)
+            bundle.remove(bundle.get_path(directory), [workspace_id],
+                          bundle.target_part(target))
+        if os.path.isdir(directory):
+            with index.edit(directory) as session_index:
+                index.remove_entries(session_index, workspace_ids,
+                                     bundle.target_part(target))
     else:
         util.eprint('either --workspace or --session option should be specified.')
         sys.exit(1)
 
 
 def delete(layout_file, programs_file, target):
-    if target != 'programs_only':
+    if target != 'layout_only' and programs_file.exists():
         # Delete programs file.
         programs_file.unlink()
 
-    if target != 'layout_only':
+    if target != 'programs_only' and layout_file.exists():
         # Delete layout file.
         layout_file.unlink()
 
@@ -389,6 +789,108 @@ def clear_directory(directory, target):
     for layout_file, programs_file in files:
         delete(layout_file, programs_file, target)
 
+    bundle.remove(bundle.get_path(directory),
+                  part=bundle.target_part(target))
+
+    with index.edit(directory) as session_index:
+        index.remove_entries(session_index,
+                             part=bundle.target_part(target))
+
+
+@main.command('daemon')
+@click.option('--numeric', '-n',
+              is_flag=True,
+              help='Save workspaces by number instead of name.')
+@click.option('--directory', '-d',
+              type=click.Path(file_okay=False, writable=True),
+              default=Path('~/.i3/i3-resurrect/').expanduser(),
+              help=('The directory to save the workspaces to.\n'
+                    '[default: ~/.i3/i3-resurrect]'))
+@click.option('--profile', '-p',
+              default=None,
+              help=('The profile to save the workspaces to.'))
+@click.option('--swallow', '-s',
+              default='class,instance',
+              help=('The swallow criteria to use.\n'
+                    '[options: class,instance,title,window_role]\n'
+                    '[default: class,instance]'))
+@click.option('--delay',
+              type=click.FloatRange(min=0),
+              default=2,
+              help=('Seconds without changes to wait for before saving.\n'
+                    '[default: 2]'))
+@click.option('--max-delay',
+              type=click.FloatRange(min=0),
+              default=30,
+              help=('Maximum number of seconds a change can stay unsaved.\n'
+                    '[default: 30]'))
+@click.option('--jobs', '-j',
+              type=click.IntRange(min=1),
+              default=4,
+              help=('The number of workspaces to save and processes to '
+                    'inspect in parallel.\n'
+                    '[default: 4]'))
+@click.option('--metrics-file',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=('Write metrics to this file in the Prometheus text format '
+                    'after every save.'))
+@click.option('--layout-only', 'target',
+              flag_value='layout_only',
+              help='Only save layouts.')
+@click.option('--programs-only', 'target',
+              flag_value='programs_only',
+              help='Only save running programs.')
+def save_daemon(numeric, directory, profile, swallow, delay, max_delay, jobs,
+                metrics_file, target):
+    """
+    Keep running and save workspaces whenever they change.
+    """
+    if profile is not None:
+        Path(directory, profile).mkdir(parents=True, exist_ok=True)
+        index.add_profile(directory, profile)
+        directory = Path(directory) / profile
+
+    # Create directory if non-existent.
+    Path(directory).mkdir(parents=True, exist_ok=True)
+
+    daemon.SaveDaemon(directory, numeric, swallow.split(','), target, delay,
+                      max_delay, jobs, metrics_file).run()
+
+
+@main.command('server')
+@click.option('--socket', '-s', 'socket_path',
+              type=click.Path(dir_okay=False),
+              default=None,
+              help=('The socket to listen on.\n'
+                    '[default: $I3_RESURRECT_SOCKET or '
+                    '$XDG_RUNTIME_DIR/i3-resurrect.sock]'))
+@click.option('--metrics-file',
+              type=click.Path(dir_okay=False, writable=True),
+              default=None,
+              help=('Write metrics to this file in the Prometheus text format '
+                    'after every command.'))
+def run_server(socket_path, metrics_file):
+    """
+    Keep running and run save, restore and load commands sent to a socket.
+
+    While the server is running, these commands are handed to it so that they
+    don't have to start from scratch.
+    """
+    # Reconnect to i3 when it restarts instead of exiting.
+    ipc.get().auto_reconnect = True
+    try:
+        command_server = server.Server(socket_path, metrics_file)
+    except (OSError, RuntimeError) as e:
+        util.eprint(f'Could not start the server: {str(e)}')
+        sys.exit(1)
+    # Remove the socket when stopped.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        command_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
 
 @main.command('close')
 @click.option('--workspace', '-w',
@@ -402,10 +904,10 @@ def close(workspace, session, workspaces):
     """
     Close workspace(s) or whole session.
     """
-    i3 = i3ipc.Connection()
+    i3 = ipc.get()
 
     if not workspaces:
-        workspaces = ( i3.get_tree().find_focused().workspace().name, )
+        workspaces = ( i3.get_focused_workspace().name, )
 
     if session:
         workspaces = layout.list(i3, False)
@@ -413,8 +915,10 @@ def close(workspace, session, workspaces):
         util.eprint('either --workspace or --session option should be specified.')
         sys.exit(1)
 
-    for workspace_id in workspaces:
-        i3.command(f'[workspace="{workspace_id}"] kill')
+    # Close all workspaces with a single message.
+    i3.command(*[
+        f'[workspace="{workspace_id}"] kill' for workspace_id in workspaces
+    ])
 
 
 if __name__ == '__main__':
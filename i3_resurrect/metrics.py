@@ -0,0 +1,232 @@
+"""
+Counters and histograms of what saving and restoring costs.
+
+The metrics live in memory for as long as the process runs. The daemon and the
+server can write them after every save or command to a file in the Prometheus
+text format, which node_exporter's textfile collector picks up.
+"""
+import math
+import threading
+
+from . import util
+
+_registry = []
+
+
+class Counter:
+    """
+    A value which only goes up.
+
+    Args:
+        name: The metric name, which should end in _total.
+        description: The help text of the metric.
+        labels: The names of the labels every sample has.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        """
+        Increase the counter.
+        """
+        key = _label_values(self, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Get the current value of the counter.
+        """
+        with self._lock:
+            return self._values.get(_label_values(self, labels), 0)
+
+    def samples(self):
+        """
+        Get the (name, labels, value) samples to export.
+        """
+        with self._lock:
+            if not self.labels and not self._values:
+                return [(self.name, {}, 0)]
+            return [
+                (self.name, dict(zip(self.labels, key)), value)
+                for key, value in sorted(self._values.items())
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+
+class Histogram:
+    """
+    A distribution of observed values, counted in cumulative buckets.
+
+    Args:
+        name: The metric name.
+        description: The help text of the metric.
+        buckets: The upper bounds of the buckets, in increasing order.
+        labels: The names of the labels every sample has.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets, labels=()):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value, **labels):
+        """
+        Record an observed value.
+        """
+        key = _label_values(self, labels)
+        with self._lock:
+            counts, total = self._values.get(key,
+                                             ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        """
+        Get the number of observed values.
+        """
+        with self._lock:
+            counts, _ = self._values.get(_label_values(self, labels),
+                                         ([0], 0))
+            return counts[-1]
+
+    def samples(self):
+        """
+        Get the (name, labels, value) samples to export.
+        """
+        samples = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                labels = dict(zip(self.labels, key))
+                for bound, count in zip(self.buckets, counts):
+                    samples.append((f'{self.name}_bucket',
+                                    dict(labels, le=_format_value(bound)),
+                                    count))
+                samples.append((f'{self.name}_sum', labels, total))
+                samples.append((f'{self.name}_count', labels, counts[-1]))
+        return samples
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+
+def counter(name, description, labels=()):
+    """
+    Create and register a Counter.
+    """
+    metric = Counter(name, description, labels)
+    _registry.append(metric)
+    return metric
+
+
+def histogram(name, description, buckets, labels=()):
+    """
+    Create and register a Histogram.
+    """
+    metric = Histogram(name, description, buckets, labels)
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    """
+    Get every registered metric in the Prometheus text format.
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ','.join(
+                    f'{label}="{_escape(label_value)}"'
+                    for label, label_value in labels.items())
+                name = f'{name}{{{label_text}}}'
+            lines.append(f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path):
+    """
+    Write every registered metric to a file for node_exporter's textfile
+    collector.
+
+    The file is replaced atomically, so the collector never reads a partly
+    written one.
+    """
+    util.write_atomic(path, render())
+
+
+def reset():
+    """
+    Forget every observed value.
+    """
+    for metric in _registry:
+        metric.reset()
+
+
+def _label_values(metric, labels):
+    return tuple(str(labels.get(label, '')) for label in metric.labels)
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+SAVE_DURATION = histogram(
+    'i3_resurrect_save_duration_seconds',
+    'Time taken to save the layout or programs of a workspace.',
+    [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    ['part'])
+
+WORKSPACE_WINDOWS = histogram(
+    'i3_resurrect_workspace_windows',
+    'Windows in a saved layout or programs of a workspace.',
+    [0, 1, 2, 5, 10, 20, 50, 100, 200, 500],
+    ['part'])
+
+WRITTEN_BYTES = counter(
+    'i3_resurrect_written_bytes_total',
+    'Bytes written to saved layout and programs files.',
+    ['part'])
+
+SKIPPED_WRITES = counter(
+    'i3_resurrect_skipped_writes_total',
+    'Saves which left the file alone because its content was unchanged.',
+    ['part'])
+
+PID_LOOKUP_FAILURES = counter(
+    'i3_resurrect_pid_lookup_failures_total',
+    'Windows whose process id could not be determined.')
+
+RESTORE_SWALLOW_LATENCY = histogram(
+    'i3_resurrect_restore_swallow_seconds',
+    'Time from launching a restored program until its window appeared.',
+    [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60])
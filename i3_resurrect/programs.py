@@ -1,46 +1,74 @@
 import json
 import shlex
 import shutil
-import subprocess
 import sys
+import threading
+import time
+from collections import Counter
 from pathlib import Path
 
-import i3ipc
-import psutil
-
+from . import bundle
 from . import config
+from . import index
+from . import ipc
+from . import metrics
+from . import timing
 from . import treeutils
 from . import util
+from . import x11
+
+# Window properties and value to add to score when match is found.
+MATCH_CRITERIA_SCORES = {
+    'window_role': 1,
+    'class': 2,
+    'instance': 3,
+    'title': 10,
+}
+
+_process_cache = None
 
 
-def save(workspace, numeric, directory):
+def save(workspace, numeric, directory, snapshot=None, cache=None,
+         skip_unchanged=False, session_index=None, executor=None):
     """
     Save the commands to launch the programs open in the specified workspace
     to a file.
-    """
-    workspace_id = util.filename_filter(workspace)
-    filename = f'workspace_{workspace_id}_programs.json'
-    programs_file = Path(directory) / filename
 
+    If a tree snapshot is given, the workspace is taken from it instead of
+    fetching the tree from i3 again. A ProcessCache can be given to share
+    process information between workspaces, and an executor to read the
+    processes in (see ProcessCache.get_many). If the index of the directory is
+    given (see index.edit), the saved programs are recorded in it.
+
+    Returns:
+        False if the file was left alone because skip_unchanged was set and
+        the programs haven't changed, otherwise True.
+    """
     # Print deprecation warning if using old dictionary method of writing
     # window command mappings.
     # TODO: Remove in 2.0.0
-    window_command_mappings = config.get('window_command_mappings', [])
-    if isinstance(window_command_mappings, dict):
+    if isinstance(config.current().window_command_mappings, dict):
         print('Warning: Defining window command mappings using a dictionary '
               'is deprecated and will be removed in favour of the list method '
               'in the next major version.')
 
-    programs = get_programs(workspace, numeric)
+    start = time.perf_counter()
+    programs = get_programs(workspace, numeric, snapshot, cache, executor)
 
     # Write list of commands to file as JSON.
-    with programs_file.open('w') as f:
-        f.write(json.dumps(programs, indent=2))
+    written = index.write_part(directory, workspace, 'programs', programs,
+                               skip_unchanged, session_index)
+    metrics.SAVE_DURATION.observe(time.perf_counter() - start,
+                                  part='programs')
+    return written
 
 
 def read(workspace, directory):
     """
     Read saved programs file.
+
+    Falls back to the session bundle if there is no programs file for the
+    workspace.
     """
     workspace_id = util.filename_filter(workspace)
     filename = f'workspace_{workspace_id}_programs.json'
@@ -50,31 +78,57 @@ def read(workspace, directory):
     try:
         programs = json.loads(programs_file.read_text())
     except FileNotFoundError:
-        util.eprint('Could not find saved programs for workspace '
-                        f'"{workspace}"')
-        sys.exit(1)
+        programs = bundle.read_workspace(bundle.get_path(directory),
+                                         workspace_id, 'programs')
+        if programs is None:
+            util.eprint('Could not find saved programs for workspace '
+                            f'"{workspace}"')
+            sys.exit(1)
     return programs
 
 
-def restore(workspace_name, saved_programs, clear):
+@timing.timed('programs.restore')
+def restore(workspace_name, saved_programs, clear, snapshot=None,
+            switch_workspace=True, i3=None):
     """
     Restore the running programs from an i3 workspace.
+
+    Args:
+        workspace_name: The name of the workspace to restore.
+        saved_programs: The saved programs of the workspace.
+        clear: Close running programs which are not in saved_programs.
+        snapshot: Optional tree snapshot to find the running programs in.
+        switch_workspace: Focus the workspace before launching each program.
+            This can be turned off when the windows will be swallowed by
+            placeholders anyway.
+        i3: The ipc.Context to use. Defaults to the shared one.
+
+    Returns:
+        The saved program entries which were launched.
     """
-    # Remove already running programs from the list of program to restore.
-    i3 = i3ipc.Connection()
+    if i3 is None:
+        i3 = ipc.get()
 
-    running_programs = get_programs(workspace_name, False)
-    for program in running_programs:
-        if program in saved_programs:
-            saved_programs.remove(program)
-        elif clear:
+    # Everything is sent to i3 in a single message where possible.
+    batch = i3.batch()
+
+    # Only launch the saved programs which are not already running.
+    running_programs = get_programs(workspace_name, False, snapshot)
+    to_launch, to_kill = diff(saved_programs, running_programs)
+
+    if clear:
+        for program in to_kill:
             window_class = program['class']
             # programs that have to be closed
             # i3.command(f'[workspace="{workspace_name}" class="{window_class}"] kill')
-            i3.command(f'[workspace="{workspace_name}" class="{window_class}"] focus')
-            i3.command(f'kill')
-
-    for entry in saved_programs:
+            # Focus and kill in one message so that another workspace being
+            # restored at the same time can't take the focus in between.
+            batch.add(('close', program),
+                      f'[workspace="{workspace_name}" '
+                      f'class="{window_class}"] focus',
+                      'kill')
+
+    for entry in to_launch:
         cmdline = entry['command']
         working_directory = entry['working_directory']
 
@@ -94,40 +148,124 @@ def restore(workspace_name, saved_programs, clear):
             command = cmdline
 
         # Execute command via i3 exec.
-        i3.command(f'workspace --no-auto-back-and-forth {workspace_name}')
-        i3.command(f'exec "cd \\"{working_directory}\\" && {command}"')
+        commands = []
+        if switch_workspace:
+            commands.append(
+                f'workspace --no-auto-back-and-forth {workspace_name}')
+        commands.append(f'exec "cd \\"{working_directory}\\" && {command}"')
+        batch.add(('launch', entry), *commands)
+
+    launched = []
+    for (action, entry), error in batch.send():
+        if error is None:
+            if action == 'launch':
+                launched.append(entry)
+        elif action == 'close':
+            util.eprint(f'Error closing "{entry.get("class")}" on workspace '
+                        f'"{workspace_name}": {error}')
+        else:
+            util.eprint(f'Error launching "{entry.get("class")}" on workspace '
+                        f'"{workspace_name}": {error}')
+    return launched
 
 
-def get_programs(workspace, numeric):
+def program_key(program):
+    """
+    Get a hashable key which identifies a saved or running program.
+    """
+    command = program.get('command')
+    if isinstance(command, list):
+        command = tuple(command)
+    return (program.get('class'), command, program.get('working_directory'))
+
+
+def diff(saved_programs, running_programs):
+    """
+    Compare the saved programs of a workspace with the running ones.
+
+    Both lists are treated as multisets, so a program saved twice but running
+    once is launched once more, and a program running twice but saved once
+    has one instance to kill. The order of each list is kept.
+
+    Args:
+        saved_programs: The saved programs of the workspace.
+        running_programs: The programs running on the workspace.
+
+    Returns:
+        A tuple of the saved programs which are not running and the running
+        programs which are not saved.
+    """
+    running = Counter(program_key(program) for program in running_programs)
+    saved = Counter()
+    to_launch = []
+    for program in saved_programs:
+        key = program_key(program)
+        if running[key] > 0:
+            running[key] -= 1
+            saved[key] += 1
+        else:
+            to_launch.append(program)
+
+    # Every running program matched by a saved one is kept.
+    to_kill = []
+    for program in running_programs:
+        key = program_key(program)
+        if saved[key] > 0:
+            saved[key] -= 1
+        else:
+            to_kill.append(program)
+
+    return to_launch, to_kill
+
+
+@timing.timed('programs.get_programs')
+def get_programs(workspace, numeric, snapshot=None, cache=None,
+                 executor=None):
     """
     Get running programs in specified workspace.
 
     Args:
         workspace: The workspace to search.
         numeric: Identify workspace by number instead of name.
+        snapshot: Optional tree snapshot to look the workspace up in.
+        cache: Optional ProcessCache to share process information between
+            calls.
+        executor: Optional executor to read the processes in.
     """
+    if cache is None:
+        cache = ProcessCache()
+
+    # Look the config up once for all windows.
+    cfg = config.current()
+
+    windows = [
+        (con, pid)
+        for con, pid in windows_in_workspace(workspace, numeric, snapshot)
+        if pid != 0
+    ]
+
+    # Get process info for all windows at once, then go through them in
+    # order so that the saved programs don't depend on which process was
+    # read first.
+    procinfos = cache.get_many([
+        (pid, con['window_properties']['class'] in cfg.terminals)
+        for con, pid in windows
+    ], executor)
+
     # Loop through windows and save commands to launch programs on saved
     # workspace.
     programs = []
-    for (con, pid) in windows_in_workspace(workspace, numeric):
-        if pid == 0:
+    for (con, pid), procinfo in zip(windows, procinfos):
+        window_class = con['window_properties']['class']
+        if procinfo is None:
             continue
 
-        # Get process info for the window.
-        procinfo = psutil.Process(pid)
-
-        # Try to get absolute path to executable.
-        exe = None
-        try:
-            exe = procinfo.exe()
-        except Exception:
-            pass
-
         # Create command to launch program.
         command = get_window_command(
             con['window_properties'],
-            procinfo.cmdline(),
-            exe,
+            procinfo['cmdline'],
+            procinfo['exe'],
+            cfg,
         )
         if command in ([], ''):
             continue
@@ -135,76 +273,210 @@ def get_programs(workspace, numeric):
         # Remove empty string arguments from command.
         command = [arg for arg in command if arg != '']
 
-        terminals = config.get('terminals', [])
-
-        window_class = con['window_properties']['class']
-
-        try:
-            # Obtain working directory using psutil.
-            if window_class in terminals:
-                # If the program is a terminal emulator, get the working
-                # directory from its first subprocess.
-                working_directory = procinfo.children()[0].cwd()
-            else:
-                working_directory = procinfo.cwd()
-        except Exception:
-            working_directory = str(Path.home())
-
         # Add the command to the list.
         programs.append({
             'class': window_class,
             'command': command,
-            'working_directory': working_directory
+            'working_directory': procinfo['working_directory'],
         })
 
     return programs
 
 
-def windows_in_workspace(workspace, numeric):
+def get_process_cache():
     """
-    Generator to iterate over windows in a workspace.
+    Get the ProcessCache shared by all saves in this process.
+    """
+    global _process_cache
+
+    if _process_cache is None:
+        _process_cache = ProcessCache()
+    return _process_cache
+
+
+class ProcessCache:
+    """
+    Cache of the process information needed to save programs, keyed by
+    (pid, create_time) so that a reused PID is never mistaken for an old
+    process.
+
+    Each process is read from /proc only once, no matter how many windows it
+    owns. The executable and cmdline are kept for as long as the process is
+    seen, while working directories can change and are only kept until
+    begin_run() is called.
+
+    The cache can be used from several threads at once.
 
     Args:
-        workspace: The name of the workspace whose windows to iterate over.
+        jobs: The number of processes get_many() reads in parallel.
     """
-    ws = treeutils.get_workspace_tree(workspace, numeric)
-    for con in treeutils.get_leaves(ws):
-        pid = get_window_pid(con)
-        yield (con, pid)
+
+    def __init__(self, jobs=4):
+        self.jobs = jobs
+        self._lock = threading.Lock()
+        self._processes = {}
+        self._working_directories = {}
+        self._seen = set()
+
+    def begin_run(self):
+        """
+        Start a new save run.
+
+        Forgets working directories and any process which wasn't seen during
+        the previous run.
+        """
+        with self._lock:
+            self._processes = {
+                key: info for key, info in self._processes.items()
+                if key in self._seen
+            }
+            self._working_directories = {}
+            self._seen = set()
+
+    @timing.timed('psutil')
+    def get(self, pid, terminal=False):
+        """
+        Get information about a process.
+
+        Args:
+            pid: The process id.
+            terminal: Whether the process is a terminal emulator, in which
+                case the working directory of its first subprocess is used.
+
+        Returns:
+            A dict with 'exe', 'cmdline' and 'working_directory' keys, or None
+            if the process doesn't exist.
+        """
+        # psutil is only imported when programs are actually saved.
+        import psutil
+
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                key = (pid, process.create_time())
+                cwd_key = key + (terminal,)
+                with self._lock:
+                    info = self._processes.get(key)
+                    working_directory = self._working_directories.get(cwd_key)
+                    self._seen.add(key)
+
+                # The process is read without holding the lock, so two threads
+                # may both read it, which does no harm.
+                if info is None:
+                    # Try to get absolute path to executable.
+                    exe = None
+                    try:
+                        exe = process.exe()
+                    except Exception:
+                        pass
+                    info = {
+                        'exe': exe,
+                        'cmdline': process.cmdline(),
+                    }
+                    with self._lock:
+                        self._processes[key] = info
+
+                if working_directory is None:
+                    working_directory = get_working_directory(process,
+                                                              terminal)
+                    with self._lock:
+                        self._working_directories[cwd_key] = working_directory
+        except psutil.Error:
+            return None
+
+        return {
+            'exe': info['exe'],
+            'cmdline': info['cmdline'],
+            'working_directory': working_directory,
+        }
+
+    def get_many(self, processes, executor=None):
+        """
+        Get information about several processes, reading up to `jobs` of them
+        in parallel.
+
+        Args:
+            processes: A list of (pid, terminal) tuples as taken by get().
+            executor: Executor to read the processes in instead of starting a
+                thread pool, e.g. the one a caller is already running in.
+
+        Returns:
+            The results of get() in the same order.
+        """
+        unique = list(dict.fromkeys(processes))
+        if executor is not None and len(unique) > 1:
+            results = list(executor.map(lambda args: self.get(*args), unique))
+        elif self.jobs <= 1 or len(unique) <= 1:
+            results = [self.get(pid, terminal) for pid, terminal in unique]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(
+                    max_workers=min(self.jobs, len(unique))) as executor:
+                results = list(executor.map(lambda args: self.get(*args),
+                                            unique))
+        found = dict(zip(unique, results))
+        return [found[process] for process in processes]
 
 
-def get_window_pid(con):
+def get_working_directory(process, terminal):
     """
-    Get window PID using xprop.
+    Get the working directory of a process.
 
     Args:
-        con: The window container node whose PID to look up.
+        process: The psutil.Process to inspect.
+        terminal: Whether the process is a terminal emulator, in which case
+            the working directory is taken from its first subprocess.
     """
-    window_id = con['window']
-    if window_id is None:
-        return 0
-
     try:
-        xprop_output = subprocess.check_output(
-            shlex.split(f'xprop _NET_WM_PID -id {window_id}'),
-            stderr=subprocess.DEVNULL,
-        ).decode('utf-8').split(' ')
-        pid = int(xprop_output[len(xprop_output) - 1])
-    except (subprocess.CalledProcessError, ValueError, IndexError):
-        return 0
+        # Obtain working directory using psutil.
+        if terminal:
+            # If the program is a terminal emulator, get the working
+            # directory from its first subprocess.
+            return process.children()[0].cwd()
+        return process.cwd()
+    except Exception:
+        return str(Path.home())
 
-    return pid
+
+def windows_in_workspace(workspace, numeric, snapshot=None):
+    """
+    Generator to iterate over windows in a workspace.
+
+    Args:
+        workspace: The name of the workspace whose windows to iterate over.
+        numeric: Identify workspace by number instead of name.
+        snapshot: Optional tree snapshot to look the workspace up in.
+    """
+    windows = treeutils.get_workspace_leaves(workspace, numeric, snapshot)
+
+    # Look up the PIDs of all windows in the workspace in one batch.
+    window_ids = [
+        con['window'] for con in windows if con['window'] is not None
+    ]
+    pids = x11.get_window_pids(window_ids)
+    failures = sum(1 for window_id in window_ids if pids.get(window_id, 0) == 0)
+    if failures:
+        metrics.PID_LOOKUP_FAILURES.inc(failures)
+
+    for con in windows:
+        pid = pids.get(con['window'], 0)
+        yield (con, pid)
 
 
-def get_window_command(window_properties, cmdline, exe):
+def get_window_command(window_properties, cmdline, exe, cfg=None):
     """
     Gets a window command.
 
-    This function starts with the process's cmdline, then loops through the
-    window mappings and scores each matching rule. The command mapping with the
-    highest score is then returned.
+    This function starts with the process's cmdline, then looks up the
+    window command mapping rule which gets the highest score for the window.
+    That mapping's command is then returned.
+
+    A config.Config can be given to avoid looking it up for every window.
     """
-    window_command_mappings = config.get('window_command_mappings', [])
+    if cfg is None:
+        cfg = config.current()
+    window_command_mappings = cfg.window_command_mappings
 
     # Remove empty args from cmdline.
     cmdline = [arg for arg in cmdline if arg != '']
@@ -232,15 +504,7 @@ def get_window_command(window_properties, cmdline, exe):
         return command
 
     # Find the mapping that gets the highest score.
-    current_score = 0
-    best_match = None
-    for rule in window_command_mappings:
-        # Calculate score.
-        score = calc_rule_match_score(rule, window_properties)
-
-        if score > current_score:
-            current_score = score
-            best_match = rule
+    best_match = cfg.mapping_matcher.match(window_properties)
 
     # If no match found, just use the original cmdline.
     if best_match is None:
@@ -267,20 +531,77 @@ def calc_rule_match_score(rule, window_properties):
 
     Scoring is done based on which criteria are considered "more specific".
     """
-    # Window properties and value to add to score when match is found.
-    criteria = {
-        'window_role': 1,
-        'class': 2,
-        'instance': 3,
-        'title': 10,
-    }
-
     score = 0
-    for criterion in criteria:
+    for criterion in MATCH_CRITERIA_SCORES:
         if criterion in rule:
             # Score is zero if there are any non-matching criteria.
             if (criterion not in window_properties
                     or rule[criterion] != window_properties[criterion]):
                 return 0
-            score += criteria[criterion]
+            score += MATCH_CRITERIA_SCORES[criterion]
     return score
+
+
+class MappingMatcher:
+    """
+    Index of window command mapping rules.
+
+    Rules are grouped by the set of criteria they use, and each group maps the
+    rules' criteria values to the first rule with those values. Finding the
+    best rule for a window then takes one dict lookup per group (there are at
+    most 15) instead of scoring every rule, and gives the same result as
+    calc_rule_match_score(): the highest score wins and earlier rules win ties.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+
+        groups = {}
+        for position, rule in enumerate(rules):
+            criteria = tuple(c for c in MATCH_CRITERIA_SCORES if c in rule)
+            # Rules without criteria score zero so they can never match.
+            if not criteria:
+                continue
+            values = tuple(rule[criterion] for criterion in criteria)
+            try:
+                groups.setdefault(criteria, {}).setdefault(
+                    values, (position, rule))
+            except TypeError:
+                # Unhashable values can't equal any window property.
+                continue
+
+        # Highest scoring groups first so that the search can stop early.
+        self._groups = sorted(
+            (
+                (sum(MATCH_CRITERIA_SCORES[c] for c in criteria), criteria,
+                 rules_by_values)
+                for criteria, rules_by_values in groups.items()
+            ),
+            key=lambda group: group[0],
+            reverse=True,
+        )
+
+    def match(self, window_properties):
+        """
+        Find the best matching rule for a window, or None if no rule matches.
+        """
+        best_score = 0
+        best_index = None
+        best_match = None
+        for score, criteria, rules_by_values in self._groups:
+            if score < best_score:
+                break
+            try:
+                values = tuple(window_properties[c] for c in criteria)
+                found = rules_by_values.get(values)
+            except (KeyError, TypeError):
+                continue
+            if found is None:
+                continue
+            rule_index, rule = found
+            if best_match is None or rule_index < best_index:
+                best_score = score
+                best_index = rule_index
+                best_match = rule
+        return best_match
+
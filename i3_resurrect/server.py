@@ -0,0 +1,276 @@
+"""
+Optional resident server which runs commands for a thin client.
+
+The server keeps the i3 connection, the config, the compiled window command
+mappings and the process cache between commands. While it is running, the
+save, restore and load commands hand their arguments to it over a Unix socket
+and print what it sends back, so a key binding doesn't have to wait for a new
+interpreter to start up. Without a server they run as usual.
+
+Requests and replies are single JSON documents:
+
+    {"args": ["save", "-w", "1"], "cwd": "/home/user"}
+    {"exit_code": 0, "stdout": "", "stderr": ""}
+"""
+import contextlib
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+from pathlib import Path
+
+# The commands which are handed to a running server.
+FORWARDED_COMMANDS = ['save', 'restore', 'load']
+
+# Seconds a client has to send its request in, and to read the reply. The
+# server handles one request at a time, so a stuck client would otherwise
+# hold up everyone else's commands.
+REQUEST_TIMEOUT = 5.0
+
+_serving = False
+
+
+def get_socket_path():
+    """
+    Get the path of the server socket.
+
+    This is $I3_RESURRECT_SOCKET if it is set, otherwise i3-resurrect.sock in
+    $XDG_RUNTIME_DIR, or a socket named after the user in /tmp.
+    """
+    socket_path = os.environ.get('I3_RESURRECT_SOCKET')
+    if socket_path:
+        return Path(socket_path)
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return Path(runtime_dir) / 'i3-resurrect.sock'
+    return Path(f'/tmp/i3-resurrect-{os.getuid()}.sock')
+
+
+def serving():
+    """
+    Check whether commands are being run by the server in this process.
+    """
+    return _serving
+
+
+def forward(args, socket_path=None):
+    """
+    Run a command on the server, printing its output.
+
+    Args:
+        args: The command line arguments.
+        socket_path: The server socket. [default: get_socket_path()]
+
+    Returns:
+        The exit code of the command, or None if no server is running.
+    """
+    if socket_path is None:
+        socket_path = get_socket_path()
+
+    # Anybody can create the socket when it is in /tmp, so only a server run
+    # by the same user is trusted with the command.
+    try:
+        owner = os.stat(socket_path).st_uid
+    except OSError:
+        return None
+    if owner != os.getuid():
+        print(f'Ignoring {socket_path}, which belongs to another user.',
+              file=sys.stderr)
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.connect(str(socket_path))
+        except OSError:
+            return None
+
+        request = {'args': list(args), 'cwd': os.getcwd()}
+        client.sendall(json.dumps(request).encode('utf-8'))
+        client.shutdown(socket.SHUT_WR)
+        try:
+            reply = json.loads(_read_all(client))
+        except (OSError, ValueError):
+            print('Lost the connection to the i3-resurrect server.',
+                  file=sys.stderr)
+            return 1
+
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    return reply['exit_code']
+
+
+class Server:
+    """
+    Runs the commands it receives one at a time.
+
+    Args:
+        socket_path: The socket to listen on. [default: get_socket_path()]
+            An already listening socket passed by systemd socket activation is
+            used instead if there is one.
+        metrics_file: A file to write the metrics to after every command (see
+            metrics.write_textfile).
+    """
+
+    def __init__(self, socket_path=None, metrics_file=None):
+        self._metrics_file = metrics_file
+        self._socket_path = None
+        self._listener = _activated_socket()
+        if self._listener is not None:
+            return
+
+        if socket_path is None:
+            socket_path = get_socket_path()
+        socket_path = Path(socket_path)
+        if _is_listening(socket_path):
+            raise RuntimeError(f'A server is already listening on '
+                               f'{socket_path}')
+        with contextlib.suppress(FileNotFoundError):
+            # Left behind by a server which didn't exit cleanly.
+            socket_path.unlink()
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(str(socket_path))
+        os.chmod(socket_path, 0o600)
+        self._listener.listen(8)
+        self._socket_path = socket_path
+
+    def serve_forever(self):
+        """
+        Handle requests until the process is stopped.
+        """
+        try:
+            while True:
+                self.handle_request()
+        finally:
+            self.close()
+
+    def handle_request(self):
+        """
+        Wait for a single request and handle it.
+        """
+        connection, _ = self._listener.accept()
+        connection.settimeout(REQUEST_TIMEOUT)
+        with connection:
+            try:
+                data = _read_all(connection)
+                if not data:
+                    # Somebody checking whether the server is running.
+                    return
+                request = json.loads(data)
+                reply = run(request['args'], request.get('cwd'))
+                connection.sendall(json.dumps(reply).encode('utf-8'))
+            except (OSError, ValueError, KeyError) as e:
+                # A client which times out ends up here too.
+                print(f'Bad request: {str(e)}', file=sys.stderr)
+
+        if self._metrics_file is not None:
+            from . import metrics
+
+            try:
+                metrics.write_textfile(self._metrics_file)
+            except OSError as e:
+                print(f'Error writing metrics: {str(e)}', file=sys.stderr)
+
+    def close(self):
+        """
+        Stop listening and remove the socket.
+        """
+        self._listener.close()
+        if self._socket_path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                self._socket_path.unlink()
+            self._socket_path = None
+
+
+def run(args, cwd=None):
+    """
+    Run a command in this process as if it had been started on its own.
+
+    Args:
+        args: The command line arguments.
+        cwd: The working directory to run it in.
+
+    Returns:
+        A reply dict with the exit code and output of the command.
+    """
+    global _serving
+
+    import click
+
+    from . import main
+
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    previous_cwd = os.getcwd()
+    _serving = True
+    try:
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            try:
+                if cwd is not None:
+                    os.chdir(cwd)
+                result = main.main(args=args, prog_name='i3-resurrect',
+                                   standalone_mode=False)
+                exit_code = result if isinstance(result, int) else 0
+            except SystemExit as e:
+                exit_code = _exit_code(e.code)
+            except click.ClickException as e:
+                e.show()
+                exit_code = e.exit_code
+            except click.Abort:
+                print('Aborted!', file=sys.stderr)
+                exit_code = 1
+            except Exception:
+                # Keep serving after a failed command.
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        _serving = False
+        os.chdir(previous_cwd)
+
+    return {
+        'exit_code': exit_code,
+        'stdout': stdout.getvalue(),
+        'stderr': stderr.getvalue(),
+    }
+
+
+def _is_listening(socket_path):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    with client:
+        try:
+            client.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def _activated_socket():
+    # See sd_listen_fds(3): the first passed file descriptor is 3.
+    if (os.environ.get('LISTEN_PID') != str(os.getpid())
+            or int(os.environ.get('LISTEN_FDS', '0')) < 1):
+        return None
+    return socket.socket(fileno=3)
+
+
+def _read_all(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b''.join(chunks).decode('utf-8')
+
+
+def _exit_code(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    # sys.exit() with a message prints it and exits with 1.
+    print(code, file=sys.stderr)
+    return 1
@@ -0,0 +1,213 @@
+"""
+Tracking of windows which are expected to be swallowed by placeholders.
+"""
+import collections
+import re
+import threading
+import time
+
+from . import ipc
+from . import metrics
+from . import util
+
+# The most windows which appeared before they were expected to remember. Only
+# the newest ones are kept, so unrelated windows opening during a long
+# restore don't pile up.
+MAX_UNCLAIMED = 100
+
+
+class SwallowTracker:
+    """
+    Listens to i3 window::new events and keeps track of which expected windows
+    have not appeared yet.
+
+    The tracker must be started before any program is launched so that no
+    window can appear before it is subscribed. Windows which appear before
+    they are expected are remembered and matched when the expectation is
+    added.
+
+    The time from an expectation being added until its window appears is
+    recorded in metrics.RESTORE_SWALLOW_LATENCY.
+    """
+
+    def __init__(self):
+        # (criteria, time expected) tuples.
+        self._pending = []
+        self._unclaimed = collections.deque(maxlen=MAX_UNCLAIMED)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._subscribed = threading.Event()
+        self._i3 = None
+        self._thread = None
+
+    def start(self, i3=None, timeout=1.0):
+        """
+        Subscribe to window events in a background thread.
+
+        Args:
+            i3: The ipc.Context whose connection to subscribe with. Defaults
+                to the shared one.
+            timeout: How long to wait for the subscription to be confirmed.
+
+        Returns:
+            False if the subscription wasn't confirmed in time, in which case
+            nothing is tracked.
+        """
+        if i3 is None:
+            i3 = ipc.get()
+        self._i3 = i3.connection
+        self._i3.on('window::new', self._on_window_new)
+        # i3 sends a tick event to every client as soon as it subscribes to
+        # ticks, which tells us that the subscription is in place.
+        self._i3.on('tick', self._on_tick)
+        self._thread = threading.Thread(target=self._i3.main, daemon=True)
+        self._thread.start()
+        if not self._subscribed.wait(timeout):
+            util.eprint('Could not subscribe to window events, not waiting '
+                        'for windows to appear.')
+            self.stop()
+            return False
+        return True
+
+    def stop(self):
+        """
+        Unsubscribe from window events.
+        """
+        if self._i3 is not None:
+            self._i3.main_quit()
+            self._thread.join(1.0)
+            self._i3.off(self._on_window_new)
+            self._i3.off(self._on_tick)
+            self._i3 = None
+
+    def expect(self, criteria):
+        """
+        Add windows to wait for.
+
+        Args:
+            criteria: List of swallow criteria dicts mapping window properties
+                to regular expressions.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for criterion in criteria:
+                for window_properties in self._unclaimed:
+                    if matches(criterion, window_properties):
+                        self._unclaimed.remove(window_properties)
+                        metrics.RESTORE_SWALLOW_LATENCY.observe(0)
+                        break
+                else:
+                    self._pending.append((criterion, now))
+
+    def expect_programs(self, saved_layout, launched_programs):
+        """
+        Add windows to wait for, one for each launched program.
+
+        A program is expected to be swallowed by the first free placeholder in
+        the saved layout which matches its window class, or otherwise to open
+        a window with that class.
+
+        Args:
+            saved_layout: The restored layout of the workspace or None.
+            launched_programs: The saved program entries which were launched.
+        """
+        placeholders = placeholder_criteria(saved_layout)
+        criteria = []
+        for program in launched_programs:
+            window_properties = {'class': program.get('class') or ''}
+            for placeholder in placeholders:
+                if matches({'class': placeholder.get('class', '')},
+                           window_properties):
+                    placeholders.remove(placeholder)
+                    criteria.append(placeholder)
+                    break
+            else:
+                escaped = re.escape(window_properties['class'])
+                criteria.append({'class': f'^{escaped}$'})
+        self.expect(criteria)
+
+    def pending(self):
+        """
+        Get the number of expected windows which have not appeared yet.
+        """
+        with self._lock:
+            return len(self._pending)
+
+    def wait(self, timeout):
+        """
+        Wait until every expected window has appeared, or until the timeout
+        expires, and stop tracking.
+
+        Args:
+            timeout: The maximum number of seconds to wait.
+
+        Returns:
+            True if every expected window appeared in time.
+        """
+        with self._lock:
+            # No more windows will be expected from now on.
+            self._closed = True
+            if not self._pending:
+                self._done.set()
+        done = self._done.wait(timeout)
+        self.stop()
+        return done
+
+    def _on_tick(self, i3, event):
+        self._subscribed.set()
+
+    def _on_window_new(self, i3, event):
+        window_properties = event.container.ipc_data.get(
+            'window_properties', {})
+        with self._lock:
+            for pending in self._pending:
+                criterion, expected = pending
+                if matches(criterion, window_properties):
+                    self._pending.remove(pending)
+                    metrics.RESTORE_SWALLOW_LATENCY.observe(
+                        time.monotonic() - expected)
+                    if self._closed and not self._pending:
+                        self._done.set()
+                    break
+            else:
+                self._unclaimed.append(window_properties)
+
+
+def placeholder_criteria(layout):
+    """
+    Get the swallow criteria of every placeholder in a saved layout.
+
+    Args:
+        layout: The saved layout tree.
+    """
+    criteria = []
+    if not layout:
+        return criteria
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        swallows = node.get('swallows')
+        if swallows:
+            criteria.append(swallows[0])
+        children = node.get('nodes', []) + node.get('floating_nodes', [])
+        stack.extend(reversed(children))
+    return criteria
+
+
+def matches(criteria, window_properties):
+    """
+    Check whether a window matches swallow criteria.
+
+    Args:
+        criteria: Dict mapping window properties to regular expressions.
+        window_properties: The window properties of an i3 container.
+    """
+    for criterion, regex in criteria.items():
+        value = window_properties.get(criterion) or ''
+        try:
+            if re.search(regex, value) is None:
+                return False
+        except re.error:
+            return False
+    return True
@@ -0,0 +1,157 @@
+"""
+Lightweight timing of the hot paths.
+
+Functions decorated with timed() and blocks wrapped in span() are recorded
+while timing is enabled (by --timings or --trace). When it is disabled, which
+is the default, a span costs a single check. The recorded spans can be
+summarised per phase or written as a Chrome trace, which flame graph viewers
+like chrome://tracing, Perfetto and speedscope can open.
+"""
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+_enabled = False
+_started = None
+_lock = threading.Lock()
+# (name, start, duration, thread id) tuples, with times in nanoseconds.
+_spans = []
+
+
+def enable():
+    """
+    Start recording spans, forgetting any recorded before.
+    """
+    global _enabled
+    global _started
+
+    with _lock:
+        _spans.clear()
+        _started = time.perf_counter_ns()
+        _enabled = True
+
+
+def disable():
+    """
+    Stop recording spans.
+    """
+    global _enabled
+
+    _enabled = False
+
+
+def enabled():
+    """
+    Check whether spans are being recorded.
+    """
+    return _enabled
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Context manager which records the time spent in a block.
+
+    Args:
+        name: The name of the phase the block belongs to.
+    """
+    if not _enabled:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        _record(name, start)
+
+
+def timed(name):
+    """
+    Decorator which records the time spent in every call to a function.
+
+    Args:
+        name: The name of the phase the function belongs to.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                _record(name, start)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """
+    Summarise the recorded spans per phase.
+
+    Returns:
+        A list of (name, calls, total, longest) tuples with times in seconds,
+        the phase with the most time spent in it first.
+    """
+    phases = {}
+    with _lock:
+        for name, _, duration, _ in _spans:
+            calls, total, longest = phases.get(name, (0, 0, 0))
+            phases[name] = (calls + 1, total + duration, max(longest,
+                                                             duration))
+    return sorted(
+        [
+            (name, calls, total / 1e9, longest / 1e9)
+            for name, (calls, total, longest) in phases.items()
+        ],
+        key=lambda phase: phase[2],
+        reverse=True,
+    )
+
+
+def print_summary(file=None):
+    """
+    Print how long each phase took.
+    """
+    if file is None:
+        file = sys.stderr
+    elapsed = (time.perf_counter_ns() - _started) / 1e9 if _started else 0
+    print(f'{"Phase":<32}{"Calls":>7}{"Total":>12}{"Max":>12}', file=file)
+    for name, calls, total, longest in summary():
+        print(f'{name:<32}{calls:>7}{total * 1000:>10.1f}ms'
+              f'{longest * 1000:>10.1f}ms', file=file)
+    # Phases nest and run in parallel threads, so their totals can add up to
+    # more than this.
+    print(f'{"Elapsed":<39}{elapsed * 1000:>10.1f}ms', file=file)
+
+
+def write_trace(path):
+    """
+    Write the recorded spans to a file in the Chrome trace event format.
+    """
+    pid = os.getpid()
+    with _lock:
+        events = [
+            {
+                'name': name,
+                'ph': 'X',
+                'ts': (start - _started) / 1000,
+                'dur': duration / 1000,
+                'pid': pid,
+                'tid': thread_id,
+            }
+            for name, start, duration, thread_id in _spans
+        ]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def _record(name, start):
+    duration = time.perf_counter_ns() - start
+    with _lock:
+        _spans.append((name, start, duration, threading.get_ident()))
@@ -1,9 +1,9 @@
 import json
 import re
-import shlex
-import subprocess
 
 from . import config
+from . import ipc
+from . import timing
 
 # The tree node attributes that we want to save.
 REQUIRED_ATTRIBUTES = [
@@ -23,97 +23,293 @@ REQUIRED_ATTRIBUTES = [
     'workspace_layout',
 ]
 
+# The start of a workspace node in the tree sent by i3, which always begins
+# with the id and type of the node.
+_WORKSPACE_NODE = re.compile(
+    r'\{\s*"id"\s*:\s*\d+\s*,\s*"type"\s*:\s*"workspace"')
 
-def process_node(original, swallow):
+_NAME_KEY = re.compile(r'"name"\s*:\s*')
+
+_NUM_KEY = re.compile(r'"num"\s*:\s*')
+
+
+def process_node(original, swallow, window_swallow_criteria=None):
     """
-    Recursive function which traverses a layout tree and builds a new tree from
-    it which can be restored using append_layout and only contains attributes
-    necessary for accurately restoring the layout.
+    Build a new tree from a layout tree which can be restored using
+    append_layout and only contains attributes necessary for accurately
+    restoring the layout.
+
+    Args:
+        original: The node to process.
+        swallow: The swallow criteria to use.
+        window_swallow_criteria: Swallow criteria per window class which
+            override swallow. [default: from the config]
     """
-    processed = {}
+    return process_tree(original, swallow, window_swallow_criteria)[0]
+
+
+@timing.timed('treeutils.process_tree')
+def process_tree(original, swallow, window_swallow_criteria=None):
+    """
+    Build the restorable layout of a tree and collect its windows in a single
+    pass.
+
+    The tree is walked iteratively, depth first, so deep trees can't hit the
+    recursion limit.
 
-    # Base case.
+    Args:
+        original: The root of the tree to process.
+        swallow: The swallow criteria to use.
+        window_swallow_criteria: Swallow criteria per window class which
+            override swallow. [default: from the config]
+
+    Returns:
+        A tuple of the processed tree (see process_node) and the list of
+        window containers below the root, in the same order as get_leaves.
+    """
+    if window_swallow_criteria is None:
+        window_swallow_criteria = config.current().window_swallow_criteria
+
+    root = {}
+    leaves = []
     if original is None or original == {}:
-        return processed
-
-    # Set attributes.
-    for attribute in REQUIRED_ATTRIBUTES:
-        if attribute in original:
-            processed[attribute] = original[attribute]
-
-    # Keep rect attribute for floating nodes.
-    if 'type' in original and original['type'] == 'floating_con':
-        processed['rect'] = original['rect']
-
-    # Set swallow criteria if the node is a window.
-    if 'window_properties' in original:
-        processed['swallows'] = [{}]
-        # Local variable for swallow criteria.
-        swallow_criteria = swallow
-        # Get swallow criteria from config.
-        window_swallow_mappings = config.get('window_swallow_criteria', {})
-        window_class = original['window_properties'].get('class', '')
-        # Swallow criteria from config override the command line parameters
-        # if present.
-        if window_class in window_swallow_mappings:
-            swallow_criteria = window_swallow_mappings[window_class]
-        for criterion in swallow_criteria:
-            if criterion in original['window_properties']:
-                # Escape special characters in swallow criteria.
-                escaped = re.escape(original['window_properties'][criterion])
-                # Regex formatting.
-                value = f'^{escaped}$'
-                processed['swallows'][0][criterion] = value
-
-    # Recurse over child nodes (normal and floating).
-    for node_type in ['nodes', 'floating_nodes']:
-        if node_type in original and original[node_type] != []:
-            processed[node_type] = []
-            for child in original[node_type]:
-                # Step case.
-                processed[node_type].append(process_node(child, swallow))
-
-    return processed
-
-
-def get_workspace_tree(workspace, numeric):
+        return root, leaves
+
+    # Window classes and instances repeat a lot, so each value is only
+    # escaped once.
+    patterns = {}
+
+    # Each entry is a node with the dict to fill in for it.
+    stack = [(original, root)]
+    while stack:
+        node, processed = stack.pop()
+
+        # Set attributes.
+        for attribute in REQUIRED_ATTRIBUTES:
+            if attribute in node:
+                processed[attribute] = node[attribute]
+
+        # Keep rect attribute for floating nodes.
+        if node.get('type') == 'floating_con':
+            processed['rect'] = node['rect']
+
+        # Set swallow criteria if the node is a window.
+        window_properties = node.get('window_properties')
+        if window_properties is not None:
+            if node is not original:
+                leaves.append(node)
+            # Swallow criteria from config override the command line
+            # parameters if present.
+            swallow_criteria = window_swallow_criteria.get(
+                window_properties.get('class', ''), swallow)
+            criteria = {}
+            for criterion in swallow_criteria:
+                if criterion in window_properties:
+                    value = window_properties[criterion]
+                    pattern = patterns.get(value)
+                    if pattern is None:
+                        # Escape special characters in swallow criteria.
+                        pattern = f'^{re.escape(value)}$'
+                        patterns[value] = pattern
+                    criteria[criterion] = pattern
+            processed['swallows'] = [criteria]
+
+        # Queue child nodes (normal and floating) so that they are processed
+        # in order.
+        children = []
+        for node_type in ['nodes', 'floating_nodes']:
+            if node.get(node_type):
+                processed[node_type] = []
+                for child in node[node_type]:
+                    child_processed = {}
+                    processed[node_type].append(child_processed)
+                    if child:
+                        children.append((child, child_processed))
+        stack.extend(reversed(children))
+
+    return root, leaves
+
+
+def process_workspace(workspace, numeric, swallow, snapshot=None):
+    """
+    Get the restorable layout and the windows of a workspace.
+
+    Both come from a single walk over the workspace, and when a snapshot is
+    given the result is kept in it, so that saving the layout and the
+    programs of a workspace only walks it once.
+
+    Args:
+        workspace: The name or number of the workspace.
+        numeric: Identify workspace by number instead of name.
+        swallow: The swallow criteria to use.
+        snapshot: Optional tree snapshot to look the workspace up in.
+
+    Returns:
+        A tuple of the layout and the list of window containers.
+    """
+    ws = get_workspace_tree(workspace, numeric, snapshot)
+    walked = _walked(snapshot, ws)
+    key = tuple(swallow)
+    if key not in walked:
+        walked[key] = process_tree(ws, swallow)
+        walked.setdefault('leaves', walked[key][1])
+    return walked[key]
+
+
+def get_workspace_leaves(workspace, numeric, snapshot=None):
+    """
+    Get the windows of a workspace, reusing the walk done by
+    process_workspace if there was one.
+
+    Args:
+        workspace: The name or number of the workspace.
+        numeric: Identify workspace by number instead of name.
+        snapshot: Optional tree snapshot to look the workspace up in.
+    """
+    ws = get_workspace_tree(workspace, numeric, snapshot)
+    walked = _walked(snapshot, ws)
+    if 'leaves' not in walked:
+        walked['leaves'] = list(get_leaves(ws))
+    return walked['leaves']
+
+
+def _walked(snapshot, ws):
+    # Results of walking the workspaces of a snapshot, keyed by container id.
+    if snapshot is None or 'id' not in ws:
+        return {}
+    return snapshot.setdefault('walked', {}).setdefault(ws['id'], {})
+
+
+@timing.timed('treeutils.get_tree_snapshot')
+def get_tree_snapshot(i3, workspaces=None, numeric=False):
+    """
+    Get a snapshot of the i3 layout tree with its workspaces indexed by name
+    and by number.
+
+    Taking one snapshot and looking up every workspace in it means that a whole
+    session is read from the same point in time with a single tree fetch.
+
+    Args:
+        i3: The ipc.Context to fetch the tree over.
+        workspaces: Only decode these workspaces (see extract_workspaces)
+            instead of the whole tree.
+        numeric: Identify the workspaces by number instead of name.
+    """
+    if workspaces is None:
+        return index_workspaces(i3.get_tree())
+    return extract_workspaces(i3.get_raw_tree(), workspaces, numeric)
+
+
+def index_workspaces(root):
+    """
+    Index the workspaces of a raw layout tree by name and by number.
+
+    Args:
+        root: The root node of the tree as returned by i3.
+    """
+    snapshot = {
+        'by_name': {},
+        'by_num': {},
+    }
+    for output in root.get('nodes', []):
+        for container in output.get('nodes', []):
+            for ws in container.get('nodes', []):
+                # Keep the first match to behave like a linear search.
+                snapshot['by_name'].setdefault(ws['name'], ws)
+                if 'num' in ws:
+                    snapshot['by_num'].setdefault(ws['num'], ws)
+    return snapshot
+
+
+def extract_workspaces(raw_tree, workspaces, numeric=False):
+    """
+    Decode only some workspaces of a raw layout tree.
+
+    The JSON text is scanned for workspace nodes, and only the ones asked
+    for are decoded, stopping as soon as all of them are found. Nothing else
+    in the tree (other workspaces, scratchpad windows, docks) is turned into
+    Python objects. If no workspace node can be found in the text, the whole
+    tree is decoded instead.
+
+    Args:
+        raw_tree: The tree as the JSON text sent by i3.
+        workspaces: The names or numbers of the workspaces to decode.
+        numeric: Identify the workspaces by number instead of name.
+
+    Returns:
+        A snapshot like index_workspaces, containing only these workspaces.
+    """
+    wanted = {str(workspace) for workspace in workspaces}
+    snapshot = {
+        'by_name': {},
+        'by_num': {},
+    }
+    decoder = json.JSONDecoder()
+    found_any = False
+    for match in _WORKSPACE_NODE.finditer(raw_tree):
+        found_any = True
+        # The name and number come before the child nodes, so the first
+        # ones after the start of the node are its own.
+        key = _NUM_KEY if numeric else _NAME_KEY
+        key_match = key.search(raw_tree, match.end())
+        if key_match is None:
+            continue
+        value, _ = decoder.raw_decode(raw_tree, key_match.end())
+        if str(value) not in wanted:
+            continue
+
+        ws, _ = decoder.raw_decode(raw_tree, match.start())
+        # Keep the first match to behave like a linear search.
+        snapshot['by_name'].setdefault(ws['name'], ws)
+        if 'num' in ws:
+            snapshot['by_num'].setdefault(ws['num'], ws)
+        wanted.discard(str(value))
+        if not wanted:
+            break
+
+    if not found_any:
+        # Not laid out the way i3 does it, so decode everything.
+        return index_workspaces(json.loads(raw_tree))
+    return snapshot
+
+
+@timing.timed('treeutils.get_workspace_tree')
+def get_workspace_tree(workspace, numeric, snapshot=None):
     """
     Get full workspace layout tree from i3.
+
+    Args:
+        workspace: The name or number of the workspace.
+        numeric: Identify workspace by number instead of name.
+        snapshot: A tree snapshot from get_tree_snapshot() to look the
+            workspace up in. If not given, a new tree is fetched from i3.
     """
-    root = json.loads(
-        subprocess.check_output(shlex.split('i3-msg -t get_tree'))
-    )
-    for output in root['nodes']:
-        for container in output['nodes']:
-            if container['type'] != 'con':
-                pass
-            for ws in container['nodes']:
-                # Select workspace and trigger name and num field
-                if numeric:
-                    if (workspace.isdigit()
-                            and 'num' in ws
-                            and ws['num'] == int(workspace)):
-                        return ws
-                elif ws['name'] == workspace:
-                    return ws
-    return {}
+    if snapshot is None:
+        snapshot = get_tree_snapshot(ipc.get(), [workspace], numeric)
+
+    workspace = str(workspace)
+    if numeric:
+        if workspace.isdigit():
+            return snapshot['by_num'].get(int(workspace), {})
+        return {}
+    return snapshot['by_name'].get(workspace, {})
 
 
 def get_leaves(container):
     """
-    Recursive generator for retrieving a list of a container's leaf nodes.
+    Generator for retrieving a list of a container's leaf nodes.
 
     Args:
         container: The container to traverse.
     """
-    # Base cases.
     if container is None:
         return
 
-    nodes = container.get('nodes', []) + container.get('floating_nodes', [])
-
-    # Step case.
-    for node in nodes:
-        if 'window_properties' in node:
+    # Depth first, normal nodes before floating nodes.
+    stack = [container]
+    while stack:
+        node = stack.pop()
+        if node is not container and 'window_properties' in node:
             yield node
-        yield from get_leaves(node)
+        stack.extend(reversed(node.get('floating_nodes', [])))
+        stack.extend(reversed(node.get('nodes', [])))
@@ -3,6 +3,8 @@ import re
 import sys
 from pathlib import Path
 
+from . import timing
+
 
 def eprint(*args, **kwargs):
     """
@@ -39,3 +41,62 @@ def list_filenames(directory):
         programs_file = Path(directory) / programs_filenames[n]
         files.append((layout_file, programs_file))
     return files
+
+
+@timing.timed('util.write_atomic')
+def write_atomic(path, data, skip_unchanged=False):
+    """
+    Write a file so that it is either completely written or left untouched.
+
+    The data is written to a temporary file in the same directory, synced to
+    disk and then renamed over the target, so a crash or a concurrent save can
+    never leave a truncated file behind.
+
+    Args:
+        path: The file to write.
+        data: The content as str or bytes.
+        skip_unchanged: Don't rewrite the file if it already has exactly this
+            content.
+
+    Returns:
+        True if the file was written, False if it was skipped.
+    """
+    path = Path(path)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    if skip_unchanged:
+        try:
+            # Only read the old content back if the size matches.
+            if (path.stat().st_size == len(data)
+                    and path.read_bytes() == data):
+                return False
+        except FileNotFoundError:
+            pass
+
+    temp_path = path.parent / f'.{path.name}.{os.urandom(4).hex()}.tmp'
+    try:
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            temp_path.unlink()
+        except FileNotFoundError:
+            pass
+        raise
+
+    # Make sure the rename itself is on disk.
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+
+    return True
@@ -0,0 +1,211 @@
+"""
+Helpers for talking to the X server directly over a single connection.
+
+python-xlib is used when it is installed and a display is available (it is a
+dependency of i3ipc so it normally is). Otherwise everything falls back to the
+xprop command line tool. python-xlib is only imported when the display is
+first needed.
+"""
+import shlex
+import subprocess
+import threading
+
+from . import timing
+
+Xlib = None
+
+_display = None
+_display_unavailable = False
+_display_lock = threading.Lock()
+# python-xlib's Display isn't thread safe unless Xlib.threaded is imported, so
+# every batch of requests on the shared display is sent and answered under
+# this lock.
+_request_lock = threading.Lock()
+_atoms = {}
+
+
+def get_display():
+    """
+    Get the persistent X display connection.
+
+    Returns None if python-xlib is not installed or the display can't be
+    opened.
+    """
+    global Xlib
+    global _display
+    global _display_unavailable
+
+    with _display_lock:
+        if _display is None and not _display_unavailable:
+            try:
+                import Xlib.display
+                import Xlib.error
+                import Xlib.protocol.request
+                import Xlib.Xatom
+                _display = Xlib.display.Display()
+            except Exception:
+                _display_unavailable = True
+    return _display
+
+
+def get_atom(display, name):
+    """
+    Get an atom by name, interning it only once per connection.
+    """
+    if name not in _atoms:
+        _atoms[name] = display.intern_atom(name)
+    return _atoms[name]
+
+
+@timing.timed('x11.get_window_pids')
+def get_window_pids(window_ids):
+    """
+    Get the _NET_WM_PID of each of the given windows.
+
+    All property requests are sent at once and the replies are read
+    afterwards, so a whole workspace costs a single round trip to the X server.
+    Falls back to one xprop call per window if no display is available.
+
+    Args:
+        window_ids: The X window ids to look up.
+
+    Returns:
+        A dict mapping each window id to its PID, or to 0 if the PID could not
+        be determined.
+    """
+    display = get_display()
+    if display is None:
+        return {
+            window_id: xprop_window_pid(window_id)
+            for window_id in window_ids
+        }
+
+    pids = {}
+    with _request_lock:
+        atom = get_atom(display, '_NET_WM_PID')
+        requests = []
+        for window_id in window_ids:
+            requests.append((
+                window_id,
+                Xlib.protocol.request.GetProperty(
+                    display=display.display,
+                    defer=True,
+                    delete=False,
+                    window=window_id,
+                    property=atom,
+                    type=Xlib.Xatom.CARDINAL,
+                    long_offset=0,
+                    long_length=1,
+                ),
+            ))
+        display.flush()
+
+        for window_id, request in requests:
+            pids[window_id] = 0
+            try:
+                request.reply()
+                # The value is a (format, data) tuple. A window without the
+                # property has neither a type nor a format.
+                value_format, data = request.value
+                if request.property_type and value_format:
+                    pids[window_id] = int(data[0])
+            except (Xlib.error.XError, IndexError, TypeError, ValueError):
+                pass
+    return pids
+
+
+@timing.timed('xprop')
+def xprop_window_pid(window_id):
+    """
+    Get a window's PID using xprop.
+
+    Args:
+        window_id: The X window id to look up.
+    """
+    try:
+        xprop_output = subprocess.check_output(
+            shlex.split(f'xprop _NET_WM_PID -id {window_id}'),
+            stderr=subprocess.DEVNULL,
+        ).decode('utf-8').split(' ')
+        pid = int(xprop_output[len(xprop_output) - 1])
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError,
+            IndexError):
+        return 0
+
+    return pid
+
+
+def unmap_windows(window_ids):
+    """
+    Unmap a batch of windows.
+    """
+    _window_operation(window_ids, 'windowunmap',
+                      lambda window: window.unmap(onerror=_ignore()))
+
+
+def map_windows(window_ids):
+    """
+    Map a batch of windows.
+    """
+    _window_operation(window_ids, 'windowmap',
+                      lambda window: window.map(onerror=_ignore()))
+
+
+def kill_windows(window_ids):
+    """
+    Kill the X clients owning a batch of windows.
+    """
+    _window_operation(window_ids, 'windowkill',
+                      lambda window: window.kill_client(onerror=_ignore()))
+
+
+def _window_operation(window_ids, xdotool_command, request):
+    """
+    Run one operation on a batch of windows in a single step.
+
+    With a display connection all requests are queued and sent together.
+    Otherwise the operations are chained into a single xdotool process, and
+    only if that fails is each window handled by its own process.
+    """
+    window_ids = list(window_ids)
+    if not window_ids:
+        return
+
+    display = get_display()
+    if display is not None:
+        with _request_lock:
+            for window_id in window_ids:
+                window = display.create_resource_object('window', window_id)
+                request(window)
+            display.sync()
+        return
+
+    command = ['xdotool']
+    for window_id in window_ids:
+        command += [xdotool_command, str(window_id)]
+    if _xdotool(command) == 0 or len(window_ids) == 1:
+        return
+
+    # A failing command ends an xdotool chain, so retry the windows one by one.
+    for window_id in window_ids:
+        _xdotool(['xdotool', xdotool_command, str(window_id)])
+
+
+@timing.timed('xdotool')
+def _xdotool(command):
+    try:
+        return subprocess.call(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.STDOUT,
+        )
+    except FileNotFoundError:
+        return 0
+
+
+def _ignore():
+    """
+    Error handler which discards errors, e.g. for windows which have already
+    been destroyed.
+    """
+    return Xlib.error.CatchError()
@@ -12,13 +12,16 @@ setup(
     author_email='jonathan@haylett.dev',
     url='https://github.com/JonnyHaystack/i3-resurrect',
     license='GNU GPL Version 3',
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=[
         'Click',
         'i3ipc',
         'natsort',
         'psutil',
     ],
+    extras_require={
+        'bundle': ['msgpack', 'zstandard'],
+    },
     entry_points={
         'console_scripts': ['i3-resurrect=i3_resurrect.main:main'],
     },
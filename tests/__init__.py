@@ -1,3 +1,17 @@
+from . import test_bundle
+from . import test_config
+from . import test_daemon
+from . import test_engine
+from . import test_index
+from . import test_ipc
 from . import test_layout
+from . import test_main
+from . import test_metrics
 from . import test_programs
+from . import test_server
+from . import test_startup
+from . import test_swallow
+from . import test_timing
 from . import test_treeutils
+from . import test_util
+from . import test_x11
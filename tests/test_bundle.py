@@ -0,0 +1,30 @@
+from i3_resurrect import bundle
+
+
+def test_bundle(tmp_path):
+    path = bundle.get_path(tmp_path)
+    workspaces = {
+        '1': {
+            'layout': {'name': '1', 'nodes': []},
+            'programs': [{'class': 'Term', 'command': ['term']}],
+        },
+        '2:web': {
+            'layout': {'name': '2:web', 'nodes': [{'swallows': [{}]}]},
+        },
+    }
+    bundle.write(path, workspaces, 'json', 'gzip')
+
+    header = bundle.read_header(path)
+    assert header['compression'] == 'gzip'
+    assert list(header['workspaces']) == ['1', '2:web']
+    assert bundle.read_workspace(path, '2:web', 'layout') == \
+        workspaces['2:web']['layout']
+    assert bundle.read_workspace(path, '2:web', 'programs') is None
+    assert bundle.read_workspace(path, '3', 'layout') is None
+    assert bundle.load(path)[1] == workspaces
+
+    bundle.remove(path, ['1'], 'programs')
+    assert bundle.load(path)[1]['1'] == {'layout': workspaces['1']['layout']}
+    bundle.remove(path)
+    assert not path.exists()
+    assert bundle.read_workspace(path, '1', 'layout') is None
@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from i3_resurrect import config
+
+
+def test_reload_on_change(monkeypatch, tmp_path):
+    config_file = tmp_path / 'config.json'
+    monkeypatch.setattr(config, '_config_dir', tmp_path)
+    monkeypatch.setattr(config, '_config_file', config_file)
+    monkeypatch.setattr(config, '_config', None)
+
+    # The default config is created on first use.
+    assert config.current().terminals == {'Gnome-terminal', 'Alacritty'}
+    assert config_file.is_file()
+
+    # The file is only parsed again when it changes.
+    loaded = config.current()
+    assert config.current() is loaded
+    config_file.write_text(json.dumps({
+        'terminals': ['URxvt'],
+        'window_swallow_criteria': {'Ario': ['class', 'instance']},
+    }))
+    os.utime(config_file, ns=(0, loaded.mtime + 1))
+    assert config.current() is not loaded
+    assert config.current().terminals == {'URxvt'}
+    assert config.current().window_swallow_criteria == {
+        'Ario': ('class', 'instance'),
+    }
+    assert config.get('window_command_mappings', []) == []
+
+
+def test_validate():
+    config.validate({'window_command_mappings': {'Term': 'term'}})
+    for data in [
+        [],
+        {'window_command_mappings': 'term'},
+        {'window_command_mappings': [{'command': 1}]},
+        {'terminals': 'URxvt'},
+        {'window_swallow_criteria': {'Ario': 'class'}},
+    ]:
+        with pytest.raises(ValueError):
+            config.validate(data)
+
+
+def test_invalid_edit_keeps_config(monkeypatch, tmp_path, capsys):
+    config_file = tmp_path / 'config.json'
+    config_file.write_text(json.dumps({'terminals': ['URxvt']}))
+    monkeypatch.setattr(config, '_config_dir', tmp_path)
+    monkeypatch.setattr(config, '_config_file', config_file)
+    monkeypatch.setattr(config, '_config', None)
+    monkeypatch.setattr(config, '_rejected_mtime', None)
+    loaded = config.current()
+
+    # A half-written edit.
+    config_file.write_text('{"terminals": [')
+    os.utime(config_file, ns=(0, loaded.mtime + 1))
+    with pytest.raises(ValueError):
+        config.load()
+    assert config.current() is loaded
+    assert 'keeping the previous config' in capsys.readouterr().err
+
+    # Only the first load exits.
+    monkeypatch.setattr(config, '_config', None)
+    with pytest.raises(SystemExit):
+        config.current()
@@ -0,0 +1,47 @@
+from i3_resurrect import daemon
+from i3_resurrect import layout
+from i3_resurrect import programs
+from i3_resurrect import treeutils
+
+
+def test_save_only_changed_workspaces(monkeypatch):
+    def workspace(name, num, window_ids):
+        return {
+            'name': name,
+            'num': num,
+            'nodes': [
+                {'id': window_id, 'window_properties': {}}
+                for window_id in window_ids
+            ],
+        }
+
+    snapshots = [
+        treeutils.index_workspaces({'nodes': [{'nodes': [{'nodes': [
+            workspace('1', 1, [10]),
+            workspace('2', 2, [20]),
+            workspace('3', 3, []),
+        ]}]}]}),
+        # Window 10 moved from workspace 1 to workspace 3.
+        treeutils.index_workspaces({'nodes': [{'nodes': [{'nodes': [
+            workspace('1', 1, []),
+            workspace('2', 2, [20]),
+            workspace('3', 3, [10]),
+        ]}]}]}),
+    ]
+    saved = []
+    monkeypatch.setattr(treeutils, 'get_tree_snapshot',
+                        lambda i3: snapshots.pop(0))
+    monkeypatch.setattr(
+        layout, 'save',
+        lambda workspace, *args, **kwargs: saved.append(('layout', workspace)))
+    monkeypatch.setattr(
+        programs, 'save',
+        lambda workspace, *args, **kwargs: saved.append(('programs', workspace)))
+
+    save_daemon = daemon.SaveDaemon('/tmp', False, ['class'], 'layout_only')
+    save_daemon.save(set(), None)
+    assert saved == [('layout', '1'), ('layout', '2'), ('layout', '3')]
+
+    saved.clear()
+    save_daemon.save({10}, set())
+    assert saved == [('layout', '1'), ('layout', '3')]
@@ -0,0 +1,116 @@
+import json
+
+from i3_resurrect import bundle
+from i3_resurrect import config
+from i3_resurrect import engine
+from i3_resurrect import layout
+from i3_resurrect import metrics
+from i3_resurrect import programs
+from i3_resurrect import treeutils
+from i3_resurrect import x11
+
+
+def test_save_workspaces_fetches_tree_over_context(monkeypatch, tmp_path):
+    class FakeContext:
+        def __init__(self):
+            self.fetched = 0
+
+        def get_raw_tree(self):
+            self.fetched += 1
+            return json.dumps({'id': 1, 'type': 'root', 'nodes': [
+                {'id': n, 'type': 'workspace', 'name': str(n), 'num': n,
+                 'layout': 'splith', 'nodes': []}
+                for n in [1, 2]
+            ]})
+
+    def save(workspace, *args):
+        if workspace == '2':
+            raise OSError('disk full')
+        saved.append(workspace)
+
+    saved = []
+    errors = []
+    monkeypatch.setattr(layout, 'save', save)
+    i3 = FakeContext()
+    engine.save_workspaces(
+        ['1', '2'], False, tmp_path, ['class'], 'layout_only', i3=i3,
+        on_error=lambda workspace, e: errors.append((workspace, str(e))))
+
+    assert i3.fetched == 1
+    assert saved == ['1']
+    assert errors == [('2', 'disk full')]
+
+
+def test_save_workspaces(monkeypatch, tmp_path):
+    def workspace(name, num, windows):
+        return {
+            'type': 'workspace',
+            'name': name,
+            'num': num,
+            'layout': 'splith',
+            'nodes': [
+                {
+                    'id': window,
+                    'window': window,
+                    'window_properties': {'class': f'C{window}'},
+                }
+                for window in windows
+            ],
+        }
+
+    snapshot = treeutils.index_workspaces({'nodes': [{'nodes': [{'nodes': [
+        workspace('1', 1, [10, 11]),
+        workspace('2', 2, []),
+        workspace('3', 3, [30]),
+    ]}]}]})
+    monkeypatch.setattr(config, '_config', {})
+    monkeypatch.setattr(x11, 'get_window_pids', lambda window_ids: {
+        window: 1000 + window for window in window_ids
+    })
+
+    class FakeCache(programs.ProcessCache):
+        executors = []
+
+        def get_many(self, processes, executor=None):
+            self.executors.append(executor)
+            return super().get_many(processes, executor)
+
+        def get(self, pid, terminal=False):
+            return {
+                'exe': None,
+                'cmdline': [f'program{pid}'],
+                'working_directory': '/',
+            }
+
+    # Saving workspaces to files drops them from the session bundle.
+    bundle_path = bundle.get_path(tmp_path)
+    bundle.write(bundle_path, {
+        '1': {'layout': {'name': '1'}, 'programs': []},
+        '9': {'layout': {'name': '9'}},
+    })
+
+    metrics.reset()
+    session_index = {'workspaces': {}}
+    cache = FakeCache()
+    engine.save_workspaces(
+        ['3', '1', '2'], False, tmp_path, ['class'], snapshot=snapshot,
+        cache=cache, session_index=session_index, jobs=2)
+
+    saved_programs = json.loads(
+        (tmp_path / 'workspace_1_programs.json').read_text())
+    assert [program['command'] for program in saved_programs] == [
+        ['program1010'], ['program1011'],
+    ]
+    saved_layout = json.loads(
+        (tmp_path / 'workspace_3_layout.json').read_text())
+    assert saved_layout['nodes'][0]['swallows'] == [{'class': '^C30$'}]
+    # The index is in the order the workspaces were given in.
+    assert list(session_index['workspaces']) == ['3', '1', '2']
+    assert session_index['workspaces']['1']['programs']['windows'] == 2
+    assert list(bundle.load(bundle_path)[1]) == ['9']
+    # Processes are read in the engine's own pool.
+    assert len(cache.executors) == 3
+    assert None not in cache.executors
+    assert metrics.SAVE_DURATION.count(part='layout') == 3
+    assert metrics.WORKSPACE_WINDOWS.count(part='programs') == 3
+    assert metrics.WRITTEN_BYTES.value(part='programs') > 0
@@ -0,0 +1,31 @@
+import json
+
+from i3_resurrect import index
+
+
+def test_index(tmp_path):
+    layout = {
+        'name': '1',
+        'nodes': [
+            {'swallows': [{'class': '^A$'}]},
+            {'nodes': [{'swallows': [{'class': '^B$'}]}]},
+        ],
+    }
+    (tmp_path / 'workspace_1_layout.json').write_text(json.dumps(layout))
+    (tmp_path / 'work').mkdir()
+
+    # A directory without an index is indexed from its files.
+    saved = index.read(tmp_path)
+    assert saved['profiles'] == ['work']
+    assert saved['workspaces']['1']['name'] == '1'
+    assert saved['workspaces']['1']['layout']['windows'] == 2
+    assert index.get_path(tmp_path).is_file()
+
+    with index.edit(tmp_path) as session_index:
+        index.set_entry(session_index, '2', 'programs', [{}, {}, {}], 100)
+    assert index.read(tmp_path)['workspaces']['2']['programs']['windows'] == 3
+
+    with index.edit(tmp_path) as session_index:
+        index.remove_entries(session_index, ['1'], 'programs')
+        index.remove_entries(session_index, ['2'], 'programs')
+    assert list(index.read(tmp_path)['workspaces']) == ['1']
@@ -0,0 +1,47 @@
+import json
+
+from i3_resurrect import ipc
+
+
+class FakeConnection:
+    def __init__(self):
+        self.messages = []
+
+    def command(self, payload):
+        self.messages.append(payload)
+        return [{'success': True}] * (payload.count(';') + 1)
+
+
+def test_command_batching():
+    connection = FakeConnection()
+    i3 = ipc.Context(connection)
+
+    replies = i3.command('[con_id=1] layout splith', '', 'append_layout /tmp/x')
+    assert connection.messages == [
+        '[con_id=1] layout splith; append_layout /tmp/x'
+    ]
+    assert len(replies) == 2
+
+    # Nothing is sent when there is nothing to do.
+    assert i3.command() == []
+    assert len(connection.messages) == 1
+
+
+class FakeTreeConnection:
+    def __init__(self, tree):
+        self.tree = tree
+        self.messages = []
+
+    def _message(self, message_type, payload):
+        self.messages.append((message_type.name, payload))
+        return json.dumps(self.tree)
+
+
+def test_get_tree():
+    tree = {'id': 1, 'type': 'root', 'nodes': []}
+    connection = FakeTreeConnection(tree)
+    i3 = ipc.Context(connection)
+
+    assert json.loads(i3.get_raw_tree()) == tree
+    assert i3.get_tree() == tree
+    assert connection.messages == [('GET_TREE', ''), ('GET_TREE', '')]
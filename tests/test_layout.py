@@ -1,4 +1,10 @@
+import json
+import os
+import types
+from pathlib import Path
+
 from i3_resurrect import config
+from i3_resurrect import ipc
 from i3_resurrect import layout
 
 
@@ -414,3 +420,78 @@ def test_build_layout(monkeypatch):
     }
     tree = layout.build_layout(workspace_container, ['class', 'instance', 'title'])
     assert tree == expected_tree
+
+
+def test_layout_file(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    with layout.LayoutFile() as layout_file:
+        if hasattr(os, 'memfd_create'):
+            assert layout_file.path.startswith('/proc/')
+        # Every write replaces the content in place.
+        layout_file.write('[{"nodes": []}]')
+        path = layout_file.path
+        layout_file.write('[]')
+        assert layout_file.path == path
+        assert Path(path).read_text() == '[]'
+
+        # Switching only happens away from a memfd.
+        assert layout_file.use_runtime_dir() == path.startswith('/proc/')
+        assert layout_file.path.startswith(str(tmp_path))
+        # A file is already in use.
+        assert not layout_file.use_runtime_dir()
+        layout_file.write('[{}]')
+        assert Path(layout_file.path).read_text() == '[{}]'
+        path = layout_file.path
+    assert layout_file.path is None
+    assert not Path(path).exists()
+
+
+def test_restore_retries_with_runtime_dir(monkeypatch, tmp_path):
+    class Reply:
+        def __init__(self, success=True, error=None):
+            self.success = success
+            self.error = error
+
+    class FakeConnection:
+        def __init__(self):
+            self.commands = []
+
+        def command(self, payload):
+            replies = []
+            for command in payload.split('; '):
+                self.commands.append(command)
+                if command.startswith('append_layout /proc/'):
+                    # i3 can't open the memfd of another process.
+                    path = command.split(' ', 1)[1]
+                    replies.append(Reply(False, f'Could not read "{path}"'))
+                    break
+                if command.startswith('append_layout '):
+                    path = command.split(' ', 1)[1]
+                    self.layouts.append(json.loads(Path(path).read_text()))
+                replies.append(Reply())
+            return replies
+
+        def get_workspaces(self):
+            return [types.SimpleNamespace(name='1', focused=True)]
+
+        def _message(self, message_type, payload):
+            return json.dumps({'id': 1, 'type': 'root', 'nodes': [
+                {'id': 2, 'type': 'workspace', 'name': '1', 'num': 1,
+                 'nodes': [], 'floating_nodes': []},
+            ]})
+
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    connection = FakeConnection()
+    connection.layouts = []
+    saved_layout = {
+        'name': '1',
+        'layout': 'splitv',
+        'nodes': [{'swallows': [{'class': '^Term$'}]}],
+    }
+
+    with layout.LayoutFile() as layout_file:
+        layout.restore('1', saved_layout, layout_file, ipc.Context(connection))
+        assert layout_file.path.startswith(str(tmp_path))
+
+    assert connection.commands[0] == '[con_id=2] layout splitv'
+    assert connection.layouts == [[saved_layout['nodes']]]
@@ -0,0 +1,99 @@
+import json
+import types
+
+from i3_resurrect import bundle
+from i3_resurrect import ipc
+from i3_resurrect import layout
+from i3_resurrect import main
+from i3_resurrect import metrics
+from i3_resurrect import programs
+
+
+class Reply:
+    def __init__(self, success=True, error=None):
+        self.success = success
+        self.error = error
+
+
+class FakeConnection:
+    def __init__(self, workspaces):
+        self.workspaces = workspaces
+        self.focused = workspaces[0]
+        self.commands = []
+
+    def command(self, payload):
+        replies = []
+        for command in payload.split('; '):
+            self.commands.append(command)
+            if command.startswith('workspace '):
+                self.focused = command.split()[-1]
+            replies.append(Reply())
+        return replies
+
+    def get_workspaces(self):
+        return [
+            types.SimpleNamespace(name=name, focused=name == self.focused)
+            for name in self.workspaces
+        ]
+
+    def _message(self, message_type, payload):
+        return json.dumps({'id': 1, 'type': 'root', 'nodes': [
+            {'id': 2, 'type': 'output', 'name': 'FAKE-1', 'nodes': [
+                {'id': 3, 'type': 'con', 'name': 'content', 'nodes': [
+                    {'id': 10 + n, 'type': 'workspace', 'name': name,
+                     'num': n, 'nodes': [], 'floating_nodes': []}
+                    for n, name in enumerate(self.workspaces, 1)
+                ]},
+            ]},
+        ]})
+
+
+def test_restore_session_appends_layouts_first(monkeypatch, tmp_path):
+    monkeypatch.setattr(programs, 'get_programs', lambda *args: [])
+    connection = FakeConnection(['1', '2', '3'])
+    saved_workspaces = [
+        (
+            {'name': name, 'layout': 'splith',
+             'nodes': [{'swallows': [{'class': f'^Program{name}$'}]}]},
+            [{'class': f'Program{name}', 'command': [f'program{name}'],
+              'working_directory': str(tmp_path)}],
+        )
+        for name in ['1', '2', '3']
+    ]
+
+    main.restore_session(ipc.Context(connection), saved_workspaces, None,
+                         False, 2)
+
+    commands = connection.commands
+    layouts = [n for n, c in enumerate(commands)
+               if c.startswith('append_layout')]
+    execs = [n for n, c in enumerate(commands) if c.startswith('exec')]
+    assert len(layouts) == 3
+    assert len(execs) == 3
+    assert max(layouts) < min(execs)
+    # The programs are swallowed by the placeholders, so the focus doesn't
+    # move while they are launched.
+    assert not any(command.startswith('workspace')
+                   for command in commands[min(execs):])
+
+
+def test_save_bundle_records_metrics(monkeypatch, tmp_path):
+    def get_workspace_layout(workspace, *args):
+        return {'name': workspace, 'nodes': [{'swallows': [{}]}]}
+
+    monkeypatch.setattr(layout, 'get_workspace_layout', get_workspace_layout)
+    monkeypatch.setattr(programs, 'get_programs', lambda *args: [])
+
+    metrics.reset()
+    for _ in range(2):
+        main.save_bundle(tmp_path, ['1', '2'], False, 'class', None, None,
+                         None, 'json', 'none', skip_unchanged=True)
+
+    header = bundle.read_header(bundle.get_path(tmp_path))
+    assert metrics.SAVE_DURATION.count(part='layout') == 4
+    assert metrics.WORKSPACE_WINDOWS.count(part='programs') == 4
+    assert metrics.WRITTEN_BYTES.value(part='layout') == sum(
+        header['workspaces'][workspace]['layout'][1]
+        for workspace in ['1', '2'])
+    # The second save left the unchanged bundle alone.
+    assert metrics.SKIPPED_WRITES.value(part='programs') == 2
@@ -0,0 +1,39 @@
+from i3_resurrect import metrics
+
+
+def test_render(monkeypatch, tmp_path):
+    requests = metrics.Counter('requests_total', 'Requests.', ['part'])
+    latency = metrics.Histogram('latency_seconds', 'Latency.', [0.1, 1],
+                                ['part'])
+    failures = metrics.Counter('failures_total', 'Failures.')
+    monkeypatch.setattr(metrics, '_registry', [requests, latency, failures])
+
+    requests.inc(part='layout')
+    requests.inc(2, part='layout')
+    requests.inc(part='a "b"')
+    latency.observe(0.05, part='layout')
+    latency.observe(0.5, part='layout')
+    latency.observe(2, part='layout')
+
+    assert requests.value(part='layout') == 3
+    assert latency.count(part='layout') == 3
+    assert metrics.render() == (
+        '# HELP requests_total Requests.\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{part="a \\"b\\""} 1\n'
+        'requests_total{part="layout"} 3\n'
+        '# HELP latency_seconds Latency.\n'
+        '# TYPE latency_seconds histogram\n'
+        'latency_seconds_bucket{part="layout",le="0.1"} 1\n'
+        'latency_seconds_bucket{part="layout",le="1"} 2\n'
+        'latency_seconds_bucket{part="layout",le="+Inf"} 3\n'
+        'latency_seconds_sum{part="layout"} 2.55\n'
+        'latency_seconds_count{part="layout"} 3\n'
+        '# HELP failures_total Failures.\n'
+        '# TYPE failures_total counter\n'
+        'failures_total 0\n'
+    )
+
+    path = tmp_path / 'i3-resurrect.prom'
+    metrics.write_textfile(path)
+    assert path.read_text() == metrics.render()
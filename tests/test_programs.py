@@ -1,5 +1,12 @@
+import contextlib
+import time
+
+import psutil
+
 from i3_resurrect import config
+from i3_resurrect import ipc
 from i3_resurrect import programs
+from i3_resurrect import x11
 
 
 def test_get_window_command(monkeypatch):
@@ -157,3 +164,238 @@ def test_get_window_command(monkeypatch):
         '--app=http://instacalc.com',
         '--user-data-dir=.config',
     ]
+
+
+def test_windows_in_workspace_batches_pid_lookup(monkeypatch):
+    workspace_tree = {
+        'nodes': [
+            {'window': 1, 'window_properties': {'class': 'A'}},
+            {
+                'window': None,
+                'nodes': [
+                    {'window': 2, 'window_properties': {'class': 'B'}},
+                ],
+            },
+        ],
+        'floating_nodes': [
+            {'window': 3, 'window_properties': {'class': 'C'}},
+        ],
+    }
+    lookups = []
+
+    def get_window_pids(window_ids):
+        lookups.append(window_ids)
+        return {1: 100, 2: 200}
+
+    monkeypatch.setattr(x11, 'get_window_pids', get_window_pids)
+    snapshot = {'by_name': {'1': workspace_tree}, 'by_num': {}}
+
+    windows = programs.windows_in_workspace('1', False, snapshot)
+    assert [(con['window'], pid) for con, pid in windows] == [
+        (1, 100),
+        (2, 200),
+        (3, 0),
+    ]
+    assert lookups == [[1, 2, 3]]
+
+
+def test_restore_batches_commands(monkeypatch, tmp_path):
+    class Reply:
+        def __init__(self, success, error=None):
+            self.success = success
+            self.error = error
+
+    class FakeConnection:
+        def __init__(self):
+            self.messages = []
+
+        def command(self, payload):
+            self.messages.append(payload)
+            replies = []
+            for command in payload.split('; '):
+                # Like i3, stop at the first command which can't be parsed.
+                if 'broken' in command:
+                    replies.append(Reply(False, 'Expected one of these'))
+                    break
+                replies.append(Reply(True))
+            return replies
+
+    monkeypatch.setattr(programs, 'get_programs', lambda *args: [])
+    connection = FakeConnection()
+    saved_programs = [
+        {'class': 'A', 'command': ['a'], 'working_directory': str(tmp_path)},
+        {'class': 'B', 'command': 'broken', 'working_directory': '/'},
+        {'class': 'C', 'command': ['c'], 'working_directory': str(tmp_path)},
+    ]
+
+    launched = programs.restore('1', list(saved_programs), False,
+                                i3=ipc.Context(connection))
+
+    # The programs after the failing one are sent again in a second message.
+    assert len(connection.messages) == 2
+    assert connection.messages[0].count('exec') == 3
+    assert connection.messages[1].count('exec') == 1
+    assert launched == [saved_programs[0], saved_programs[2]]
+
+
+def test_restore_reports_failed_close(monkeypatch, capsys):
+    class Reply:
+        def __init__(self, success, error=None):
+            self.success = success
+            self.error = error
+
+    class FakeConnection:
+        def command(self, payload):
+            # No window matches the criteria of the first focus.
+            return [Reply(False, 'No window matches given criteria')] + [
+                Reply(True) for _ in payload.split('; ')[1:]
+            ]
+
+    running = [
+        {'class': 'A', 'command': ['a'], 'working_directory': '/'},
+        {'class': 'B', 'command': ['b'], 'working_directory': '/'},
+    ]
+    monkeypatch.setattr(programs, 'get_programs', lambda *args: running)
+
+    launched = programs.restore('1', [], True,
+                                i3=ipc.Context(FakeConnection()))
+
+    assert launched == []
+    assert capsys.readouterr().err == (
+        'Error closing "A" on workspace "1": '
+        'No window matches given criteria\n')
+
+
+def test_process_cache(monkeypatch):
+    reads = []
+
+    class FakeProcess:
+        def __init__(self, pid):
+            self.pid = pid
+
+        @contextlib.contextmanager
+        def oneshot(self):
+            yield
+
+        def create_time(self):
+            return 1000.0 + self.pid
+
+        def exe(self):
+            reads.append(('exe', self.pid))
+            return f'/usr/bin/program{self.pid}'
+
+        def cmdline(self):
+            reads.append(('cmdline', self.pid))
+            return [f'program{self.pid}']
+
+        def cwd(self):
+            reads.append(('cwd', self.pid))
+            return '/tmp'
+
+    monkeypatch.setattr(psutil, 'Process', FakeProcess)
+    cache = programs.ProcessCache()
+
+    expected = {
+        'exe': '/usr/bin/program1',
+        'cmdline': ['program1'],
+        'working_directory': '/tmp',
+    }
+    assert cache.get(1) == expected
+    assert cache.get(1) == expected
+    assert reads == [('exe', 1), ('cmdline', 1), ('cwd', 1)]
+
+    # Only the working directory is read again in a new run.
+    cache.begin_run()
+    assert cache.get(1) == expected
+    assert reads[3:] == [('cwd', 1)]
+
+
+def test_get_programs_keeps_window_order(monkeypatch):
+    workspace_tree = {
+        'nodes': [
+            {'window': window, 'window_properties': {'class': f'C{window}'}}
+            for window in range(1, 9)
+        ],
+    }
+    snapshot = {'by_name': {'1': workspace_tree}, 'by_num': {}}
+    monkeypatch.setattr(config, '_config', {})
+    # Two windows of the same process.
+    monkeypatch.setattr(x11, 'get_window_pids', lambda window_ids: {
+        window: 100 + window // 2 for window in window_ids
+    })
+
+    class SlowCache(programs.ProcessCache):
+        def get(self, pid, terminal=False):
+            # Make the first processes finish last.
+            time.sleep((110 - pid) / 1000)
+            reads.append(pid)
+            return {
+                'exe': None,
+                'cmdline': [f'program{pid}'],
+                'working_directory': '/',
+            }
+
+    reads = []
+    result = programs.get_programs('1', False, snapshot, SlowCache(jobs=4))
+    assert [program['command'] for program in result] == [
+        [f'program{100 + window // 2}'] for window in range(1, 9)
+    ]
+    assert sorted(reads) == list(range(100, 105))
+
+
+def test_mapping_matcher():
+    rules = [
+        {'class': 'Term', 'command': 'first'},
+        {'instance': 'term'},
+        {'class': 'Term', 'command': 'second'},
+        {'window_role': 'browser', 'class': 'Web'},
+        {'command': 'no criteria'},
+        {'class': ['not', 'hashable']},
+    ]
+    matcher = programs.MappingMatcher(rules)
+
+    window_properties = [
+        {'class': 'Term', 'instance': 'other'},
+        {'class': 'Term', 'instance': 'term'},
+        {'class': 'Web', 'instance': 'web', 'window_role': 'browser'},
+        {'class': 'Web', 'instance': 'web', 'window_role': None},
+        {'title': 'Something'},
+    ]
+    for properties in window_properties:
+        scores = [programs.calc_rule_match_score(rule, properties)
+                  for rule in rules]
+        best_score = max(scores)
+        expected = rules[scores.index(best_score)] if best_score else None
+        assert matcher.match(properties) is expected
+
+
+def test_diff():
+    def program(window_class, command):
+        return {
+            'class': window_class,
+            'command': command,
+            'working_directory': '/home/user',
+        }
+
+    saved_programs = [
+        program('Firefox', ['firefox']),
+        program('URxvt', ['urxvt']),
+        program('URxvt', ['urxvt']),
+        program('Emacs', 'emacs'),
+    ]
+    running_programs = [
+        program('URxvt', ['urxvt']),
+        program('Firefox', ['firefox']),
+        program('Firefox', ['firefox']),
+        program('Emacs', ['emacs']),
+    ]
+
+    to_launch, to_kill = programs.diff(saved_programs, running_programs)
+    assert to_launch == [
+        program('URxvt', ['urxvt']),
+        program('Emacs', 'emacs'),
+    ]
+    assert to_kill == [
+        program('Firefox', ['firefox']),
+        program('Emacs', ['emacs']),
+    ]
@@ -0,0 +1,55 @@
+import os
+import socket
+import threading
+
+from i3_resurrect import server
+
+
+def test_forward(tmp_path, capsys):
+    socket_path = tmp_path / 'server.sock'
+    assert server.forward(['ls'], socket_path) is None
+
+    command_server = server.Server(socket_path)
+    thread = threading.Thread(
+        target=lambda: [command_server.handle_request() for _ in range(2)])
+    thread.start()
+    try:
+        (tmp_path / 'workspace_1_layout.json').write_text('{"name": "1"}')
+        assert server.forward(['ls', '-d', str(tmp_path)], socket_path) == 0
+        assert capsys.readouterr().out == 'Workspace 1 layout\n'
+
+        # Errors are passed on to the client.
+        assert server.forward(['rm', '-d', str(tmp_path)], socket_path) == 1
+        assert 'should be specified' in capsys.readouterr().err
+    finally:
+        thread.join(5)
+        command_server.close()
+    assert not socket_path.exists()
+
+
+def test_forward_ignores_foreign_socket(monkeypatch, tmp_path, capsys):
+    socket_path = tmp_path / 'server.sock'
+    command_server = server.Server(socket_path)
+    try:
+        monkeypatch.setattr(os, 'getuid',
+                            lambda: os.stat(socket_path).st_uid + 1)
+        assert server.forward(['ls'], socket_path) is None
+        assert 'belongs to another user' in capsys.readouterr().err
+    finally:
+        command_server.close()
+
+
+def test_stuck_client_times_out(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(server, 'REQUEST_TIMEOUT', 0.1)
+    socket_path = tmp_path / 'server.sock'
+    command_server = server.Server(socket_path)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(socket_path))
+        # The request is never finished.
+        client.sendall(b'{"args": ')
+        command_server.handle_request()
+        assert 'Bad request: timed out' in capsys.readouterr().err
+    finally:
+        client.close()
+        command_server.close()
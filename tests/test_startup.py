@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+
+# Modules which must not be imported just to start the command line
+# interface, or to run the commands which don't talk to i3.
+HEAVY_MODULES = ['asyncio', 'i3ipc', 'natsort', 'psutil', 'Xlib', 'msgpack',
+                 'zstandard']
+
+# Maximum cumulative time to import the command line interface, in
+# microseconds. It is generous because the tests may run without bytecode
+# caches on a busy machine.
+IMPORT_BUDGET = 300000
+
+
+def run_python(code, env=None):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        check=True,
+    )
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    import_times = {}
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+def test_import_time():
+    import_times = run_python('import i3_resurrect.main')
+    for module in HEAVY_MODULES:
+        assert module not in import_times
+    assert import_times['i3_resurrect.main'] < IMPORT_BUDGET
+
+
+def test_ls_imports(tmp_path):
+    env = dict(os.environ, HOME=str(tmp_path))
+    code = (
+        'import sys\n'
+        'from i3_resurrect.main import main\n'
+        f'main(["ls", "-d", "{tmp_path}"], standalone_mode=False)\n'
+        f'main(["rm", "-d", "{tmp_path}", "-w", "1"], standalone_mode=False)\n'
+    )
+    import_times = run_python(code, env)
+    for module in ['i3ipc', 'psutil', 'Xlib']:
+        assert module not in import_times
+
+    # The config is not created or read.
+    assert not (tmp_path / '.config').exists()
@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+from i3_resurrect import swallow
+
+
+def window_new_event(window_properties):
+    container = SimpleNamespace(
+        ipc_data={'window_properties': window_properties},
+    )
+    return SimpleNamespace(container=container)
+
+
+def test_swallow_tracker():
+    saved_layout = {
+        'nodes': [
+            {'swallows': [{'class': '^Firefox$', 'title': '^Mail$'}]},
+            {
+                'nodes': [
+                    {'swallows': [{'class': '^Alacritty$'}]},
+                ],
+            },
+        ],
+    }
+    tracker = swallow.SwallowTracker()
+
+    # A window which appears before it is expected is remembered.
+    tracker._on_window_new(None, window_new_event({'class': 'Alacritty'}))
+    tracker.expect_programs(saved_layout, [
+        {'class': 'Firefox'},
+        {'class': 'Alacritty'},
+        {'class': 'Gimp'},
+    ])
+    assert tracker.pending() == 2
+
+    # Firefox is expected to be swallowed by its placeholder.
+    tracker._on_window_new(None, window_new_event({
+        'class': 'Firefox',
+        'title': 'Other',
+    }))
+    assert tracker.pending() == 2
+    tracker._on_window_new(None, window_new_event({
+        'class': 'Firefox',
+        'title': 'Mail',
+    }))
+    tracker._on_window_new(None, window_new_event({'class': 'Gimp'}))
+    assert tracker.pending() == 0
+    assert tracker.wait(0)
+
+
+def test_unconfirmed_subscription(capsys):
+    class FakeConnection:
+        def __init__(self):
+            self.handlers = []
+
+        def on(self, event, handler):
+            self.handlers.append(handler)
+
+        def off(self, handler):
+            self.handlers.remove(handler)
+
+        def main(self):
+            # The tick event never arrives.
+            pass
+
+        def main_quit(self):
+            pass
+
+    connection = FakeConnection()
+    tracker = swallow.SwallowTracker()
+    assert not tracker.start(SimpleNamespace(connection=connection), 0.01)
+    assert connection.handlers == []
+    assert 'Could not subscribe' in capsys.readouterr().err
+
+
+def test_unclaimed_windows_are_capped(monkeypatch):
+    monkeypatch.setattr(swallow, 'MAX_UNCLAIMED', 2)
+    tracker = swallow.SwallowTracker()
+    for window_class in ['A', 'B', 'C']:
+        tracker._on_window_new(None, window_new_event({'class': window_class}))
+
+    # Only the newest windows are remembered.
+    tracker.expect([{'class': '^A$'}, {'class': '^C$'}])
+    assert tracker.pending() == 1
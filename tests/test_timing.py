@@ -0,0 +1,39 @@
+import io
+import json
+
+from i3_resurrect import timing
+
+
+def test_timing(tmp_path):
+    @timing.timed('outer')
+    def outer():
+        for _ in range(3):
+            with timing.span('inner'):
+                pass
+
+    # Nothing is recorded while timing is disabled.
+    outer()
+    assert timing.summary() == []
+
+    timing.enable()
+    try:
+        outer()
+    finally:
+        timing.disable()
+    outer()
+
+    phases = {name: calls for name, calls, _, _ in timing.summary()}
+    assert phases == {'outer': 1, 'inner': 3}
+    assert timing.summary()[0][0] == 'outer'
+
+    output = io.StringIO()
+    timing.print_summary(output)
+    assert 'inner' in output.getvalue()
+
+    trace_path = tmp_path / 'trace.json'
+    timing.write_trace(trace_path)
+    events = json.loads(trace_path.read_text())['traceEvents']
+    assert sorted(event['name'] for event in events) == [
+        'inner', 'inner', 'inner', 'outer',
+    ]
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in events)
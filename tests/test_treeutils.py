@@ -1,3 +1,6 @@
+import json
+
+from i3_resurrect import config
 from i3_resurrect import treeutils
 
 
@@ -346,3 +349,130 @@ def test_windows_in_container():
     }
     windows = treeutils.get_leaves(workspace_tree)
     assert windows is not None
+
+
+def test_get_workspace_tree_from_snapshot():
+    workspace_1 = {'type': 'workspace', 'name': '1', 'num': 1, 'nodes': []}
+    workspace_2 = {'type': 'workspace', 'name': '2:web', 'num': 2, 'nodes': []}
+    scratchpad = {'type': 'workspace', 'name': '__i3_scratch', 'num': -1}
+    root = {
+        'nodes': [
+            {
+                'name': '__i3',
+                'nodes': [{'type': 'con', 'nodes': [scratchpad]}],
+            },
+            {
+                'name': 'HDMI-1',
+                'nodes': [
+                    {'type': 'dockarea', 'nodes': []},
+                    {'type': 'con', 'nodes': [workspace_1, workspace_2]},
+                ],
+            },
+        ],
+    }
+    snapshot = treeutils.index_workspaces(root)
+
+    assert treeutils.get_workspace_tree('2:web', False, snapshot) is workspace_2
+    assert treeutils.get_workspace_tree('2', True, snapshot) is workspace_2
+    assert treeutils.get_workspace_tree(1, True, snapshot) is workspace_1
+    assert treeutils.get_workspace_tree('web', True, snapshot) == {}
+    assert treeutils.get_workspace_tree('3', False, snapshot) == {}
+
+
+def test_extract_workspaces():
+    def workspace(ws_id, name, num):
+        return {'id': ws_id, 'type': 'workspace', 'name': name, 'num': num,
+                'nodes': [{'id': ws_id + 1, 'type': 'con',
+                           'name': '"name": "2:web"', 'nodes': []}]}
+
+    workspace_1 = workspace(10, '1', 1)
+    workspace_2 = workspace(20, '2:web', 2)
+    root = {'id': 1, 'type': 'root', 'nodes': [
+        {'id': 2, 'type': 'output', 'name': '__i3', 'nodes': [
+            {'id': 3, 'type': 'con', 'nodes': [
+                workspace(30, '__i3_scratch', -1)]}]},
+        {'id': 4, 'type': 'output', 'name': 'HDMI-1', 'nodes': [
+            {'id': 5, 'type': 'con', 'nodes': [workspace_1, workspace_2]}]},
+    ]}
+    raw_tree = json.dumps(root)
+
+    snapshot = treeutils.extract_workspaces(raw_tree, ['2:web'])
+    assert snapshot == {'by_name': {'2:web': workspace_2},
+                        'by_num': {2: workspace_2}}
+    snapshot = treeutils.extract_workspaces(raw_tree, [1, '3'], True)
+    assert snapshot == {'by_name': {'1': workspace_1},
+                        'by_num': {1: workspace_1}}
+
+    # Not ordered the way i3 does it, so everything is decoded.
+    raw_tree = json.dumps(root, sort_keys=True)
+    snapshot = treeutils.extract_workspaces(raw_tree, ['2:web'])
+    assert snapshot['by_name']['2:web'] == workspace_2
+
+
+def test_process_workspace(monkeypatch):
+    monkeypatch.setattr(config, '_config', {})
+
+    def window(n, window_class):
+        return {
+            'id': n,
+            'type': 'con',
+            'name': f'window {n}',
+            'window': n,
+            'window_properties': {'class': window_class, 'title': f'{n}.*'},
+            'nodes': [],
+        }
+
+    workspace = {
+        'id': 1,
+        'type': 'workspace',
+        'name': '1',
+        'num': 1,
+        'layout': 'splith',
+        'nodes': [
+            window(2, 'Term'),
+            {
+                'id': 3,
+                'type': 'con',
+                'layout': 'tabbed',
+                'nodes': [window(4, 'Web'), window(5, 'Term')],
+            },
+        ],
+        'floating_nodes': [
+            {
+                'id': 6,
+                'type': 'floating_con',
+                'rect': {'x': 0, 'y': 0, 'width': 10, 'height': 10},
+                'nodes': [window(7, 'Dialog')],
+            },
+        ],
+    }
+    snapshot = {'by_name': {'1': workspace}, 'by_num': {1: workspace}}
+
+    layout, windows = treeutils.process_workspace(
+        '1', False, ['class', 'title'], snapshot)
+    assert [con['id'] for con in windows] == [2, 4, 5, 7]
+    assert windows == list(treeutils.get_leaves(workspace))
+    assert layout['nodes'][1]['nodes'][0] == {
+        'name': 'window 4',
+        'type': 'con',
+        'swallows': [{'class': '^Web$', 'title': r'^4\.\*$'}],
+    }
+    assert layout['floating_nodes'][0]['rect']['width'] == 10
+
+    # The walk is reused for the programs of the workspace.
+    assert treeutils.get_workspace_leaves('1', True, snapshot) is windows
+    assert treeutils.process_workspace(
+        '1', False, ['class', 'title'], snapshot)[0] is layout
+
+
+def test_process_deep_tree():
+    tree = {'type': 'workspace', 'nodes': []}
+    node = tree
+    for n in range(5000):
+        child = {'type': 'con', 'layout': 'splitv', 'nodes': []}
+        node['nodes'].append(child)
+        node = child
+    node['window_properties'] = {'class': 'Term'}
+
+    layout, windows = treeutils.process_tree(tree, ['class'], {})
+    assert windows == [node]
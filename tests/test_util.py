@@ -0,0 +1,20 @@
+from i3_resurrect import util
+
+
+def test_write_atomic(tmp_path):
+    path = tmp_path / 'workspace_1_layout.json'
+
+    assert util.write_atomic(path, '{"name": "1"}')
+    assert path.read_text() == '{"name": "1"}'
+
+    # Unchanged content is only skipped when asked to.
+    mtime = path.stat().st_mtime_ns
+    assert not util.write_atomic(path, '{"name": "1"}', skip_unchanged=True)
+    assert path.stat().st_mtime_ns == mtime
+    assert util.write_atomic(path, '{"name": "1"}')
+
+    assert util.write_atomic(path, b'{"name": "2"}', skip_unchanged=True)
+    assert path.read_text() == '{"name": "2"}'
+
+    # No temporary files are left behind.
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
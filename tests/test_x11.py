@@ -0,0 +1,72 @@
+import subprocess
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+from i3_resurrect import x11
+
+
+def test_window_operations_chain_xdotool(monkeypatch):
+    monkeypatch.setattr(x11, 'get_display', lambda: None)
+    calls = []
+
+    def call(command, **kwargs):
+        calls.append(command)
+        return 0
+
+    monkeypatch.setattr(subprocess, 'call', call)
+
+    x11.unmap_windows([1, 2, 3])
+    x11.kill_windows([])
+    assert calls == [
+        ['xdotool', 'windowunmap', '1', 'windowunmap', '2', 'windowunmap',
+         '3'],
+    ]
+
+
+def test_window_pid_requests_do_not_interleave(monkeypatch):
+    # Requests queued by one thread must be answered before another thread
+    # queues its own on the shared display.
+    queued = []
+
+    class GetProperty:
+        def __init__(self, window, **kwargs):
+            queued.append(window)
+            time.sleep(0.001)
+            self.window = window
+            # Like python-xlib's reply: the format, then the data.
+            if window % 8:
+                self.property_type = 6
+                self.value = (32, [window * 10])
+            else:
+                self.property_type = 0
+                self.value = (0, [])
+
+        def reply(self):
+            assert queued.pop(0) == self.window
+
+    class Display:
+        display = None
+
+        def intern_atom(self, name):
+            return 1
+
+        def flush(self):
+            pass
+
+    fake_xlib = types.SimpleNamespace(
+        protocol=types.SimpleNamespace(
+            request=types.SimpleNamespace(GetProperty=GetProperty)),
+        Xatom=types.SimpleNamespace(CARDINAL=6),
+        error=types.SimpleNamespace(XError=LookupError),
+    )
+    monkeypatch.setattr(x11, 'Xlib', fake_xlib)
+    monkeypatch.setattr(x11, 'get_display', lambda: Display())
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(x11.get_window_pids,
+                                    [[n, n + 1, n + 2] for n in range(8)]))
+    assert results[3] == {3: 30, 4: 40, 5: 50}
+    # Window 8 has no _NET_WM_PID.
+    assert results[6] == {6: 60, 7: 70, 8: 0}
+    assert queued == []